@@ -1,24 +1,38 @@
 import os
 import time
+import threading
 from flask import Flask, jsonify
 from flask_cors import CORS
-from app.config import UPLOAD_MAX_AGE_SECONDS, MAX_UPLOAD_SIZE_MB
+from app.config import UPLOAD_MAX_AGE_SECONDS, UPLOAD_CLEANUP_INTERVAL_SECONDS, UPLOAD_TEMP_POOL_SIZE, MAX_UPLOAD_SIZE_MB
+from app.services.temp_pool import TempFilePool
 
 
 def _cleanup_stale_uploads(upload_folder):
     """Remove upload files older than UPLOAD_MAX_AGE_SECONDS."""
-    now = time.time()
+    cutoff = time.time() - UPLOAD_MAX_AGE_SECONDS
     try:
-        for filename in os.listdir(upload_folder):
-            filepath = os.path.join(upload_folder, filename)
-            if os.path.isfile(filepath):
-                age = now - os.path.getmtime(filepath)
-                if age > UPLOAD_MAX_AGE_SECONDS:
-                    os.unlink(filepath)
+        # scandir entries carry the file type and a cached stat: one syscall per file
+        with os.scandir(upload_folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass
     except OSError:
         pass
 
 
+def _start_upload_cleanup(upload_folder):
+    """Sweep stale uploads in a daemon thread, now and every UPLOAD_CLEANUP_INTERVAL_SECONDS."""
+    def run():
+        while True:
+            _cleanup_stale_uploads(upload_folder)
+            time.sleep(UPLOAD_CLEANUP_INTERVAL_SECONDS)
+
+    threading.Thread(target=run, name='upload-cleanup', daemon=True).start()
+
+
 def create_app():
     app = Flask(__name__)
     CORS(app)
@@ -26,10 +40,20 @@ def create_app():
     app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE_MB * 1024 * 1024
 
+    # Let a fronting web server (Apache mod_xsendfile, lighttpd) send files with sendfile(2)
+    app.use_x_sendfile = bool(os.environ.get('USE_X_SENDFILE'))
+    # nginx equivalent: internal location that maps to UPLOAD_FOLDER (e.g. /protected-uploads/)
+    app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-    # Clean up stale uploads older than 24 hours
-    _cleanup_stale_uploads(app.config['UPLOAD_FOLDER'])
+    # Scratch files for uploads that need conversion or denoising
+    app.extensions['upload_temp_pool'] = TempFilePool(
+        os.path.join(app.config['UPLOAD_FOLDER'], '.tmp'), size=UPLOAD_TEMP_POOL_SIZE,
+    )
+
+    # Clean up stale uploads older than 24 hours without delaying startup
+    _start_upload_cleanup(app.config['UPLOAD_FOLDER'])
 
     from app.routes import tts, stt, audio, profiles, system, history, chatterbox
     app.register_blueprint(tts.bp)
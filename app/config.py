@@ -14,7 +14,14 @@ MAX_UPLOAD_SIZE_MB = 50
 MAX_HISTORY_ITEMS = 50
 MAX_CACHED_AUDIO = 100
 AUDIO_CACHE_TTL_SECONDS = 3600  # 1 hour
+MAX_STREAM_CACHE_SECONDS = 120  # longer streams are played but not cached for download
+REF_AUDIO_CACHE_BYTES = 64 * 1024 * 1024  # decoded reference uploads kept for repeat clone requests
+STREAM_MIN_WRITE_BYTES = 8192  # streamed audio is coalesced into writes of at least this size
+STREAM_MAX_WRITE_DELAY = 0.05  # ...unless buffered bytes have waited this long (seconds, checked per chunk)
 UPLOAD_MAX_AGE_SECONDS = 86400  # 24 hours
+UPLOAD_CLEANUP_INTERVAL_SECONDS = 3600  # stale-upload sweep period
+UPLOAD_BUFFER_SIZE = 1024 * 1024  # 1 MiB copy buffer when streaming uploads to disk
+UPLOAD_TEMP_POOL_SIZE = 8  # reusable scratch files for upload conversion
 
 # Speech enhancement (ClearerVoice)
 CLEARVOICE_MODEL = "MossFormer2_SE_48K"
@@ -25,6 +32,9 @@ TTS_FAST_MODEL_ENABLED = True  # Load 0.6B models for fast mode
 STT_MODEL_CACHE_PATH = "/data/models/whisper"
 STT_MODEL_NAME = "large-v3-turbo"
 STT_DEVICE_INDEX = 1  # GPU index for Whisper STT
+STT_SAMPLE_RATE = 16000  # Whisper expects 16 kHz mono when given an array
+STT_DENOISE_MIN_SECONDS = 2.0  # shorter clips skip noise reduction
+STT_DENOISE_MIN_RMS = 1e-3  # near-silent clips skip noise reduction
 
 # Chatterbox TTS
 CHATTERBOX_DEVICE = "cuda:0"
@@ -36,12 +46,20 @@ CHATTERBOX_LANGUAGES = [
     ("pl", "Polish"), ("pt", "Portuguese"), ("ru", "Russian"), ("sv", "Swedish"),
     ("sw", "Swahili"), ("tr", "Turkish"), ("zh", "Chinese"),
 ]
+VALID_CHATTERBOX_LANG_IDS = frozenset(code for code, _ in CHATTERBOX_LANGUAGES)
+CHATTERBOX_LANGUAGE_RESPONSE = [{'id': code, 'name': name} for code, name in CHATTERBOX_LANGUAGES]
 MAX_EXAGGERATION = 2.0
 
 # Audio ID validation (must be UUID format)
-AUDIO_ID_PATTERN = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+AUDIO_ID_LENGTH = 36
+AUDIO_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
 
 
 def is_valid_audio_id(audio_id: str) -> bool:
     """Validate that an audio ID is a safe UUID string."""
-    return bool(AUDIO_ID_PATTERN.match(audio_id))
+    # Length check rejects most bad input before the regex engine runs
+    return (
+        isinstance(audio_id, str)
+        and len(audio_id) == AUDIO_ID_LENGTH
+        and AUDIO_ID_PATTERN.fullmatch(audio_id) is not None
+    )
@@ -1,15 +1,26 @@
 import os
+import shutil
 import uuid
-import tempfile
-import numpy as np
+import wave
+from contextlib import ExitStack
 import soundfile as sf
-from flask import Blueprint, request, jsonify, current_app
-from app.config import is_valid_audio_id
-from app.services.audio_utils import reduce_noise, convert_to_wav
+from flask import Blueprint, request, jsonify, current_app, Response
+from app.config import UPLOAD_BUFFER_SIZE, is_valid_audio_id
+from app.services.audio_utils import reduce_noise, decode_to_array, is_wav_file
 
 bp = Blueprint('audio', __name__, url_prefix='/api/audio')
 
 
+def _is_pcm16_wav(path):
+    """True for a RIFF/WAVE file already stored as 16-bit PCM (header only)."""
+    if not is_wav_file(path):
+        return False
+    try:
+        return sf.info(path).subtype == 'PCM_16'
+    except Exception:
+        return False
+
+
 @bp.route('/upload', methods=['POST'])
 def upload_audio():
     """Upload audio file for voice cloning reference"""
@@ -30,40 +41,55 @@ def upload_audio():
 
         # Save as WAV for consistency
         save_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{audio_id}.wav")
-
-        # Read and resave to ensure WAV format
-        tmp_path = None
-        wav_path = None
-        try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio_file.filename)[1]) as tmp:
-                audio_file.save(tmp.name)
-                tmp_path = tmp.name
-            # Convert to WAV if needed (e.g. WebM from browser recording)
-            wav_path = convert_to_wav(tmp_path)
-
-            # Read audio
-            data, sr = sf.read(wav_path)
-
-            # Apply noise reduction if requested
-            denoised = False
-            if denoise:
-                try:
-                    data = reduce_noise(data, sr)
-                    denoised = True
-                except Exception as e:
-                    print(f"Noise reduction failed, using original: {e}")
-
-            # Get duration
-            duration = len(data) / sr
-
-            # Save as WAV
-            sf.write(save_path, data, sr)
-
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                os.unlink(tmp_path)
-            if wav_path and wav_path != tmp_path and os.path.exists(wav_path):
-                os.unlink(wav_path)
+        ext = os.path.splitext(audio_file.filename)[1].lower()
+
+        src_path = None
+        denoised = False
+        with ExitStack() as stack:
+            try:
+                if ext == '.wav' and not denoise:
+                    # Common case: stream straight to the final path, no re-encode
+                    audio_file.save(save_path, buffer_size=UPLOAD_BUFFER_SIZE)
+                    src_path = save_path
+                else:
+                    pool = current_app.extensions['upload_temp_pool']
+                    src_path = stack.enter_context(pool.slot(suffix=ext))
+                    audio_file.save(src_path, buffer_size=UPLOAD_BUFFER_SIZE)
+
+                if denoise or not _is_pcm16_wav(src_path):
+                    # Float/24-bit WAVs are rewritten as PCM_16 too
+                    try:
+                        # Stored uploads are 16-bit PCM; only denoising needs float samples
+                        data, sr = sf.read(src_path, dtype='float32' if denoise else 'int16', always_2d=False)
+                    except Exception:
+                        # Not libsndfile-readable (e.g. WebM from browser recording):
+                        # decode through an ffmpeg pipe, no intermediate WAV file
+                        sr = 24000
+                        data = decode_to_array(src_path, sr)
+
+                    # Apply noise reduction if requested
+                    if denoise:
+                        try:
+                            data = reduce_noise(data, sr)
+                            denoised = True
+                        except Exception as e:
+                            print(f"Noise reduction failed, using original: {e}")
+
+                    sf.write(save_path, data, sr, subtype='PCM_16')
+                elif src_path != save_path:
+                    # 16-bit WAV under another extension (e.g. a 'blob' upload):
+                    # copy it out of the pooled slot, which must stay in the pool
+                    shutil.copyfile(src_path, save_path)
+
+                # Get duration from the header only
+                with sf.SoundFile(save_path) as f:
+                    sr = f.samplerate
+                    duration = f.frames / sr
+
+            except Exception:
+                if os.path.exists(save_path):
+                    os.unlink(save_path)
+                raise
 
         return jsonify({
             'id': audio_id,
@@ -83,12 +109,11 @@ def delete_audio(audio_id):
         return jsonify({'error': 'Invalid audio ID'}), 400
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{audio_id}.wav")
 
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Audio not found'}), 404
-
     try:
         os.unlink(file_path)
         return jsonify({'success': True})
+    except FileNotFoundError:
+        return jsonify({'error': 'Audio not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -101,10 +126,18 @@ def stream_audio(audio_id):
     from flask import send_file
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{audio_id}.wav")
 
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Audio not found'}), 404
+    accel_prefix = current_app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if accel_prefix:
+        # nginx serves the file itself from its internal location
+        return Response(mimetype='audio/wav', headers={
+            'X-Accel-Redirect': f"{accel_prefix.rstrip('/')}/{audio_id}.wav",
+        })
 
-    return send_file(file_path, mimetype='audio/wav')
+    try:
+        # Range/conditional requests are answered by Werkzeug without re-reading the file
+        return send_file(file_path, mimetype='audio/wav', conditional=True, etag=True)
+    except FileNotFoundError:
+        return jsonify({'error': 'Audio not found'}), 404
 
 
 @bp.route('/trim/<audio_id>', methods=['POST'])
@@ -113,8 +146,8 @@ def trim_audio(audio_id):
     if not is_valid_audio_id(audio_id):
         return jsonify({'error': 'Invalid audio ID'}), 400
 
-    request_data = request.get_json()
-    if request_data is None:
+    request_data = request.get_json(silent=True)
+    if not isinstance(request_data, dict):
         return jsonify({'error': 'Invalid JSON'}), 400
 
     try:
@@ -130,52 +163,82 @@ def trim_audio(audio_id):
         return jsonify({'error': 'end must be non-negative'}), 400
 
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{audio_id}.wav")
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Audio not found'}), 404
+    new_id = str(uuid.uuid4())
+    new_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{new_id}.wav")
 
     try:
-        audio_data, sr = sf.read(file_path)
-
-        start_sample = int(start * sr)
-        end_sample = int(end * sr) if end is not None else len(audio_data)
-
-        if start_sample >= len(audio_data):
-            return jsonify({'error': 'start exceeds audio duration'}), 400
-        if end_sample <= start_sample:
-            return jsonify({'error': 'end must be greater than start'}), 400
-        end_sample = min(end_sample, len(audio_data))
-
-        trimmed = audio_data[start_sample:end_sample]
-
-        new_id = str(uuid.uuid4())
-        new_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{new_id}.wav")
-        sf.write(new_path, trimmed, sr)
+        try:
+            # PCM WAV: copy the frame range as-is, no decode/re-encode
+            with wave.open(file_path, 'rb') as w:
+                params = w.getparams()
+                sr = params.framerate
+                start_sample, end_sample, err = _trim_window(start, end, sr, params.nframes)
+                if err:
+                    return jsonify({'error': err}), 400
+                w.setpos(start_sample)
+                frames = w.readframes(end_sample - start_sample)
+
+            with wave.open(new_path, 'wb') as out:
+                out.setparams(params)
+                out.writeframes(frames)
+            num_frames = len(frames) // (params.sampwidth * params.nchannels)
+
+        except wave.Error:
+            # Not integer PCM (e.g. float WAV); fall back to libsndfile.
+            # Open via Python so a missing file raises FileNotFoundError, not a libsndfile error
+            with open(file_path, 'rb') as fp, sf.SoundFile(fp) as f:
+                sr = f.samplerate
+                subtype = f.subtype
+                start_sample, end_sample, err = _trim_window(start, end, sr, f.frames)
+                if err:
+                    return jsonify({'error': err}), 400
+
+                # Read only the trim window
+                f.seek(start_sample)
+                trimmed = f.read(end_sample - start_sample, dtype='float32', always_2d=False)
+
+            sf.write(new_path, trimmed, sr, subtype=subtype)
+            num_frames = len(trimmed)
 
         return jsonify({
             'id': new_id,
-            'duration': len(trimmed) / sr,
+            'duration': num_frames / sr,
             'sample_rate': sr,
         })
+    except FileNotFoundError:
+        return jsonify({'error': 'Audio not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+def _trim_window(start, end, sr, total_frames):
+    """Convert start/end seconds to a clamped frame range, or an error message."""
+    start_sample = int(start * sr)
+    end_sample = int(end * sr) if end is not None else total_frames
+
+    if start_sample >= total_frames:
+        return None, None, 'start exceeds audio duration'
+    if end_sample <= start_sample:
+        return None, None, 'end must be greater than start'
+    return start_sample, min(end_sample, total_frames), None
+
+
 @bp.route('/info/<audio_id>', methods=['GET'])
 def get_audio_info(audio_id):
     """Get audio file info (duration, sample rate)."""
     if not is_valid_audio_id(audio_id):
         return jsonify({'error': 'Invalid audio ID'}), 400
     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{audio_id}.wav")
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'Audio not found'}), 404
 
     try:
-        data, sr = sf.read(file_path)
-        duration = len(data) / sr
+        with open(file_path, 'rb') as fp:
+            info = sf.info(fp)
         return jsonify({
             'id': audio_id,
-            'duration': duration,
-            'sample_rate': sr,
+            'duration': info.frames / info.samplerate,
+            'sample_rate': info.samplerate,
         })
+    except FileNotFoundError:
+        return jsonify({'error': 'Audio not found'}), 404
     except Exception as e:
         return jsonify({'error': str(e)}), 500
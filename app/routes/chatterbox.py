@@ -1,16 +1,27 @@
 import io
 import os
-import struct
+import logging
 import uuid
 import zipfile
-import numpy as np
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import soundfile as sf
-from flask import Blueprint, request, jsonify, Response, current_app
+from flask import Blueprint, jsonify, Response, current_app, g
 from app.services.chatterbox_service import chatterbox_service
-from app.config import MAX_EXAGGERATION, CHATTERBOX_LANGUAGES, is_valid_audio_id
-from app.routes.tts import _cache_audio, _validate_text, _extract_post_processing, create_wav_header
+from app.services.audio_utils import PCM16Encoder
+from app.services.zip_stream import stream_zip
+from app.services.json_utils import dumps as json_dumps
+from app.config import MAX_EXAGGERATION, MAX_STREAM_CACHE_SECONDS, VALID_CHATTERBOX_LANG_IDS, CHATTERBOX_LANGUAGE_RESPONSE, is_valid_audio_id
+from app.routes.tts import WAV_HEADER_SIZE, _cache_wav, _parse_json_body, _cache_stream_wav, _coalesce_stream, _stream_error, _stream_marker, _validate_text, _extract_post_processing, create_wav_header
+
+log = logging.getLogger(__name__)
 
 bp = Blueprint('chatterbox', __name__, url_prefix='/api/tts/chatterbox')
+bp.before_request(_parse_json_body)
+
+# Static, so serialized once at import
+_LANGUAGES_JSON = json_dumps(CHATTERBOX_LANGUAGE_RESPONSE)
 
 
 def _extract_chatterbox_params(data):
@@ -71,26 +82,24 @@ def _resolve_chatterbox_ref(data):
 @bp.route('/generate', methods=['POST'])
 def chatterbox_generate():
     """Generate speech using Chatterbox TTS with optional voice cloning."""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
+    data = g.data
 
     text = data.get('text')
     language_id = data.get('language_id', 'en')
 
-    params, param_err = _extract_chatterbox_params(data)
-    if param_err:
-        return jsonify({'error': param_err}), 400
-
+    # Cheap rejecting checks first
     err = _validate_text(text)
     if err:
         return jsonify({'error': err}), 400
 
     # Validate language
-    valid_lang_ids = [code for code, name in CHATTERBOX_LANGUAGES]
-    if language_id not in valid_lang_ids:
+    if not isinstance(language_id, str) or language_id not in VALID_CHATTERBOX_LANG_IDS:
         return jsonify({'error': f'Invalid language: {language_id}'}), 400
 
+    params, param_err = _extract_chatterbox_params(data)
+    if param_err:
+        return jsonify({'error': param_err}), 400
+
     audio_prompt_path, ref_err = _resolve_chatterbox_ref(data)
     if ref_err:
         return jsonify({'error': ref_err[0]}), ref_err[1]
@@ -108,15 +117,12 @@ def chatterbox_generate():
             **params,
         )
 
+        # Encode once; the cache keeps these bytes for download/history replays
         job_id = str(uuid.uuid4())
-        _cache_audio(job_id, wav, sr)
-
-        buffer = io.BytesIO()
-        sf.write(buffer, wav, sr, format='WAV')
-        buffer.seek(0)
+        wav_bytes = _cache_wav(job_id, wav, sr)
 
         return Response(
-            buffer.read(),
+            wav_bytes,
             mimetype='audio/wav',
             headers={
                 'X-Job-Id': job_id,
@@ -130,25 +136,22 @@ def chatterbox_generate():
 @bp.route('/stream', methods=['POST'])
 def chatterbox_stream():
     """Stream speech generation using Chatterbox TTS."""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
+    data = g.data
 
     text = data.get('text')
     language_id = data.get('language_id', 'en')
 
-    params, param_err = _extract_chatterbox_params(data)
-    if param_err:
-        return jsonify({'error': param_err}), 400
-
     err = _validate_text(text)
     if err:
         return jsonify({'error': err}), 400
 
-    valid_lang_ids = [code for code, name in CHATTERBOX_LANGUAGES]
-    if language_id not in valid_lang_ids:
+    if not isinstance(language_id, str) or language_id not in VALID_CHATTERBOX_LANG_IDS:
         return jsonify({'error': f'Invalid language: {language_id}'}), 400
 
+    params, param_err = _extract_chatterbox_params(data)
+    if param_err:
+        return jsonify({'error': param_err}), 400
+
     audio_prompt_path, ref_err = _resolve_chatterbox_ref(data)
     if ref_err:
         return jsonify({'error': ref_err[0]}), ref_err[1]
@@ -157,54 +160,63 @@ def chatterbox_stream():
     if pp_err:
         return jsonify({'error': pp_err}), 400
 
+    sample_rate = chatterbox_service.output_sample_rate(post_processing)
+    max_cache_bytes = MAX_STREAM_CACHE_SECONDS * sample_rate * 2
+
     def generate():
-        header_sent = False
-        all_chunks = []
-        sample_rate = None
+        # Keep the int16 PCM we already emit for the cache instead of float
+        # copies, behind a header slot so it becomes the cached WAV in place
+        pcm = bytearray(WAV_HEADER_SIZE)
+        encoder = PCM16Encoder()
+
+        # The rate is fixed by the request, so the header (and with it the
+        # HTTP response) goes out while the model is still generating
+        yield create_wav_header(sample_rate)
 
         try:
-            for chunk, sr in chatterbox_service.generate_streaming(
+            for chunk, _ in chatterbox_service.generate_streaming(
                 text=text,
                 language_id=language_id,
                 audio_prompt_path=audio_prompt_path,
                 post_processing=post_processing,
                 **params,
             ):
-                if not header_sent:
-                    sample_rate = sr
-                    yield create_wav_header(sr)
-                    header_sent = True
-
-                audio_int16 = np.clip(chunk * 32767, -32768, 32767).astype(np.int16)
-                all_chunks.append(chunk)
-                yield audio_int16.tobytes()
-
-            if all_chunks:
-                full_audio = np.concatenate(all_chunks)
+                # Consumed (cached, coalesced) before the next encode; see tts.py
+                audio_bytes = memoryview(encoder.encode(chunk)).cast('B')
+                if pcm is not None:
+                    if len(pcm) + len(audio_bytes) > max_cache_bytes:
+                        # Too long to keep in worker memory; still streamed, not cached
+                        log.warning("Chatterbox stream exceeded %ss, not caching", MAX_STREAM_CACHE_SECONDS)
+                        pcm = None
+                    else:
+                        pcm += audio_bytes
+                yield audio_bytes
+
+            if pcm is not None and len(pcm) > WAV_HEADER_SIZE:
                 job_id = str(uuid.uuid4())
-                _cache_audio(job_id, full_audio, sample_rate)
-                yield f"<!--JOB_ID:{job_id}-->".encode()
+                _cache_stream_wav(job_id, pcm, sample_rate)
+                yield _stream_marker('JOB_ID', job_id)
 
         except Exception as e:
-            print(f"Streaming chatterbox error: {e}")
-            yield f"<!--ERROR:{str(e)}-->".encode()
+            yield _stream_error('chatterbox', e)
 
+    # _coalesce_stream only yields bytes, so Werkzeug's encoding wrapper
+    # around the iterable can be skipped
     return Response(
-        generate(),
+        _coalesce_stream(generate()),
         mimetype='audio/wav',
         headers={
             'Cache-Control': 'no-cache',
             'Transfer-Encoding': 'chunked',
-        }
+        },
+        direct_passthrough=True,
     )
 
 
 @bp.route('/batch', methods=['POST'])
 def chatterbox_batch():
     """Batch generate speech for multiple texts. Returns a zip of WAV files."""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
+    data = g.data
 
     texts = data.get('texts', [])
     if not isinstance(texts, list) or len(texts) == 0:
@@ -212,16 +224,19 @@ def chatterbox_batch():
     if len(texts) > 50:
         return jsonify({'error': 'Maximum 50 texts per batch'}), 400
 
+    for i, text in enumerate(texts):
+        text_err = _validate_text(text)
+        if text_err:
+            return jsonify({'error': f'Item {i}: {text_err}'}), 400
+
     language_id = data.get('language_id', 'en')
+    if not isinstance(language_id, str) or language_id not in VALID_CHATTERBOX_LANG_IDS:
+        return jsonify({'error': f'Invalid language: {language_id}'}), 400
 
     params, param_err = _extract_chatterbox_params(data)
     if param_err:
         return jsonify({'error': param_err}), 400
 
-    valid_lang_ids = [code for code, name in CHATTERBOX_LANGUAGES]
-    if language_id not in valid_lang_ids:
-        return jsonify({'error': f'Invalid language: {language_id}'}), 400
-
     audio_prompt_path, ref_err = _resolve_chatterbox_ref(data)
     if ref_err:
         return jsonify({'error': ref_err[0]}), ref_err[1]
@@ -230,39 +245,70 @@ def chatterbox_batch():
     if pp_err:
         return jsonify({'error': pp_err}), 400
 
-    try:
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for i, text in enumerate(texts):
-                text_err = _validate_text(text)
-                if text_err:
-                    return jsonify({'error': f'Item {i}: {text_err}'}), 400
-
-                wav, sr = chatterbox_service.generate(
-                    text=text,
-                    language_id=language_id,
-                    audio_prompt_path=audio_prompt_path,
-                    post_processing=post_processing,
-                    **params,
-                )
-
-                audio_buf = io.BytesIO()
-                sf.write(audio_buf, wav, sr, format='WAV')
-                zf.writestr(f'output_{i+1:03d}.wav', audio_buf.getvalue())
-
-        zip_buffer.seek(0)
-        return Response(
-            zip_buffer.read(),
-            mimetype='application/zip',
-            headers={
-                'Content-Disposition': 'attachment; filename="chatterbox_batch.zip"'
-            }
+    def render(text):
+        wav, sr = chatterbox_service.generate(
+            text=text,
+            language_id=language_id,
+            audio_prompt_path=audio_prompt_path,
+            post_processing=post_processing,
+            **params,
         )
+        audio_buf = io.BytesIO()
+        sf.write(audio_buf, wav, sr, format='WAV')
+        # libsndfile needs a seekable target, so encode once and hand zipfile a view
+        return audio_buf.getbuffer()
+
+    def generate_members():
+        # Pipeline two items: while one runs on the GPU (serialized by gpu0_lock),
+        # the previous one is post-processed and encoded. Bounded so memory
+        # stays at ~two WAVs however large the batch is.
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chatterbox-batch')
+        pending = deque()
+        try:
+            for i, text in enumerate(texts):
+                pending.append((i, pool.submit(render, text)))
+                if len(pending) == 2:
+                    j, future = pending.popleft()
+                    yield f'output_{j+1:03d}.wav', future.result()
+            while pending:
+                j, future = pending.popleft()
+                yield f'output_{j+1:03d}.wav', future.result()
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # Generate the first item up front so model errors still return a JSON 500
+    members = generate_members()
+    try:
+        first = next(members)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # PCM barely compresses, so store by default; opt-in DEFLATE stays cheap
+    if data.get('compress', False):
+        compression, compresslevel = zipfile.ZIP_DEFLATED, 1
+    else:
+        compression, compresslevel = zipfile.ZIP_STORED, None
+
+    def stream():
+        try:
+            yield from stream_zip(
+                itertools.chain([first], members),
+                compression=compression, compresslevel=compresslevel,
+            )
+        except Exception:
+            # Headers are already sent; the truncated archive signals failure
+            log.exception("Chatterbox batch error")
+
+    return Response(
+        stream(),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': 'attachment; filename="chatterbox_batch.zip"'
+        }
+    )
+
 
 @bp.route('/languages', methods=['GET'])
 def chatterbox_languages():
     """Get supported Chatterbox languages."""
-    return jsonify([{'id': code, 'name': name} for code, name in CHATTERBOX_LANGUAGES])
+    return Response(_LANGUAGES_JSON, mimetype='application/json')
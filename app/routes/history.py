@@ -1,36 +1,59 @@
 import io
 import os
+import atexit
+import hashlib
+import logging
 import uuid
+import shutil
 import tempfile
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, request, jsonify, current_app, send_file, Response
 import soundfile as sf
 from app.config import MAX_HISTORY_ITEMS as MAX_HISTORY, is_valid_audio_id
+from app.services.json_utils import dumps as json_dumps
+
+log = logging.getLogger(__name__)
 
 bp = Blueprint('history', __name__, url_prefix='/api/history')
 
-# In-memory history with thread lock
-_history = []
+# In-memory history with thread lock; the deque drops the oldest item itself
+_history = deque(maxlen=MAX_HISTORY)
+# Live items by id. Deleting only drops the id here, leaving a tombstone in
+# _history that is skipped on read and compacted away once the deque fills.
+_history_by_id = {}
 _history_lock = threading.Lock()
+# Bumped on every mutation; list_history re-serializes only when it changes
+_history_version = 0
+_history_json = None  # (version, body, etag)
+
+# Disk writes/deletes run off the request thread. One worker keeps them in
+# submission order, so a delete can never land before the write it follows.
+_io_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history-io')
+atexit.register(_io_pool.shutdown, wait=True)
 
 
 def get_history_dir():
-    history_dir = os.path.join(
-        os.path.dirname(current_app.config['UPLOAD_FOLDER']), 'history'
-    )
-    os.makedirs(history_dir, exist_ok=True)
+    # Resolved and created once per app, not on every request
+    history_dir = current_app.extensions.get('history_dir')
+    if history_dir is None:
+        history_dir = os.path.join(
+            os.path.dirname(current_app.config['UPLOAD_FOLDER']), 'history'
+        )
+        os.makedirs(history_dir, exist_ok=True)
+        current_app.extensions['history_dir'] = history_dir
     return history_dir
 
 
-def _persist_audio(audio_id):
+def _persist_audio(audio_id, history_dir):
     """Copy audio from in-memory cache to disk for persistence."""
     from app.routes.tts import get_cached_audio
     entry = get_cached_audio(audio_id)
     if entry is None:
         return
     wav, sr = entry
-    history_dir = get_history_dir()
     path = os.path.join(history_dir, f"{audio_id}.wav")
     if not os.path.exists(path):
         # Atomic write: temp file then rename to prevent corruption from concurrent writes
@@ -40,23 +63,97 @@ def _persist_audio(audio_id):
             sf.write(tmp_path, wav, sr, format='WAV')
             os.replace(tmp_path, path)
         except Exception:
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+            _safe_unlink(tmp_path)
             raise
 
 
+def _persist_audio_logged(audio_id, history_dir):
+    try:
+        _persist_audio(audio_id, history_dir)
+    except Exception:
+        # Runs on _io_pool, where nothing else would report the failure
+        log.exception("Failed to persist history audio %s", audio_id)
+
+
+def _safe_unlink(path, dir_fd=None):
+    """Delete path; a missing file (or any other OS error) is not fatal."""
+    try:
+        os.unlink(path, dir_fd=dir_fd)
+    except OSError:
+        pass
+
+
+def _unlink_audio_files(history_dir, audio_ids):
+    """Delete the history audio files for audio_ids, ignoring missing ones."""
+    if os.unlink not in os.supports_dir_fd:
+        for audio_id in audio_ids:
+            _safe_unlink(os.path.join(history_dir, f"{audio_id}.wav"))
+        return
+
+    # Resolve the directory once and unlink relative to it (unlinkat).
+    # Opened per call since clear_history replaces the directory.
+    try:
+        dir_fd = os.open(history_dir, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        for audio_id in audio_ids:
+            _safe_unlink(f"{audio_id}.wav", dir_fd=dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def _clear_audio_dir(history_dir):
+    """Remove every history audio file in one tree walk."""
+    shutil.rmtree(history_dir, ignore_errors=True)
+    os.makedirs(history_dir, exist_ok=True)
+
+
+def _mark_history_dirty():
+    """Invalidate the serialized history. Caller holds _history_lock."""
+    global _history_version
+    _history_version += 1
+
+
+def _audio_ids(items):
+    return [
+        item['audio_id'] for item in items
+        if item.get('audio_id') and is_valid_audio_id(item['audio_id'])
+    ]
+
+
 @bp.route('', methods=['GET'])
 def list_history():
     """List generation history."""
-    with _history_lock:
-        return jsonify(_history[-MAX_HISTORY:])
+    global _history_json
+    # Fast path without the lock: both reads are atomic, and a mutation
+    # in between only makes the versions differ and takes the slow path
+    cached = _history_json
+    version = _history_version
+    if cached is None or cached[0] != version:
+        with _history_lock:
+            version = _history_version
+            live = [h for h in _history if h['id'] in _history_by_id]
+
+        # Serialize the snapshot outside the lock
+        body = json_dumps(live)
+        # Content hash, so ETags stay valid across restarts
+        cached = (version, body, hashlib.md5(body).hexdigest())
+        with _history_lock:
+            if _history_version == version:
+                _history_json = cached
+
+    _, body, etag = cached
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
 
 
 @bp.route('', methods=['POST'])
 def add_history():
     """Add item to history and persist its audio to disk."""
-    data = request.get_json()
-    if data is None:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
         return jsonify({'error': 'Invalid JSON'}), 400
 
     if not data.get('mode') or not data.get('text'):
@@ -74,28 +171,30 @@ def add_history():
         'created_at': datetime.now(timezone.utc).isoformat(),
     }
 
+    history_dir = get_history_dir()
+
     # Persist audio from cache to disk before it expires
     if audio_id and is_valid_audio_id(audio_id):
-        try:
-            _persist_audio(audio_id)
-        except Exception as e:
-            print(f"Warning: failed to persist history audio {audio_id}: {e}")
+        _io_pool.submit(_persist_audio_logged, audio_id, history_dir)
 
     with _history_lock:
+        if len(_history) == MAX_HISTORY and len(_history_by_id) < MAX_HISTORY:
+            # Full only because of tombstones: drop those rather than a live item
+            live = [h for h in _history if h['id'] in _history_by_id]
+            _history.clear()
+            _history.extend(live)
+
+        # Trim history: the append below evicts the oldest item
+        old_item = _history[0] if len(_history) == MAX_HISTORY else None
         _history.append(item)
+        _history_by_id[item['id']] = item
+        if old_item is not None:
+            del _history_by_id[old_item['id']]
+        _mark_history_dirty()
 
-        # Trim history
-        while len(_history) > MAX_HISTORY:
-            old_item = _history.pop(0)
-            # Delete old audio file from disk
-            old_audio_id = old_item.get('audio_id')
-            if old_audio_id and is_valid_audio_id(old_audio_id):
-                old_path = os.path.join(get_history_dir(), f"{old_audio_id}.wav")
-                if os.path.exists(old_path):
-                    try:
-                        os.unlink(old_path)
-                    except OSError:
-                        pass
+    # Delete old audio file from disk
+    if old_item is not None:
+        _io_pool.submit(_unlink_audio_files, history_dir, _audio_ids([old_item]))
 
     return jsonify(item)
 
@@ -104,19 +203,13 @@ def add_history():
 def delete_history_item(item_id):
     """Delete a history item and its audio file."""
     with _history_lock:
-        removed = [h for h in _history if h['id'] == item_id]
-        _history[:] = [h for h in _history if h['id'] != item_id]
+        removed = _history_by_id.pop(item_id, None)
+        if removed is not None:
+            _mark_history_dirty()
 
     # Clean up audio file
-    for item in removed:
-        audio_id = item.get('audio_id')
-        if audio_id and is_valid_audio_id(audio_id):
-            path = os.path.join(get_history_dir(), f"{audio_id}.wav")
-            if os.path.exists(path):
-                try:
-                    os.unlink(path)
-                except OSError:
-                    pass
+    if removed is not None:
+        _io_pool.submit(_unlink_audio_files, get_history_dir(), _audio_ids([removed]))
 
     return jsonify({'success': True})
 
@@ -125,19 +218,12 @@ def delete_history_item(item_id):
 def clear_history():
     """Clear all history and audio files."""
     with _history_lock:
-        items = list(_history)
         _history.clear()
+        _history_by_id.clear()
+        _mark_history_dirty()
 
     # Clean up all audio files
-    for item in items:
-        audio_id = item.get('audio_id')
-        if audio_id and is_valid_audio_id(audio_id):
-            path = os.path.join(get_history_dir(), f"{audio_id}.wav")
-            if os.path.exists(path):
-                try:
-                    os.unlink(path)
-                except OSError:
-                    pass
+    _io_pool.submit(_clear_audio_dir, get_history_dir())
 
     return jsonify({'success': True})
 
@@ -149,18 +235,15 @@ def get_history_audio(audio_id):
         return jsonify({'error': 'Invalid audio ID'}), 400
 
     # Try in-memory cache first (fastest)
-    from app.routes.tts import get_cached_audio
-    entry = get_cached_audio(audio_id)
-    if entry:
-        wav, sr = entry
-        buffer = io.BytesIO()
-        sf.write(buffer, wav, sr, format='WAV')
-        buffer.seek(0)
-        return send_file(buffer, mimetype='audio/wav')
-
-    # Fall back to disk (persisted history audio)
-    path = os.path.join(get_history_dir(), f"{audio_id}.wav")
-    if os.path.exists(path):
-        return send_file(path, mimetype='audio/wav')
+    from app.routes.tts import get_cached_wav_bytes
+    wav_bytes = get_cached_wav_bytes(audio_id)
+    if wav_bytes is not None:
+        return send_file(io.BytesIO(wav_bytes), mimetype='audio/wav')
 
-    return jsonify({'error': 'Audio not found or expired'}), 404
+    # Fall back to disk (persisted history audio). Conditional so repeat
+    # fetches get 304/Range responses; X-Sendfile applies when enabled.
+    path = os.path.join(get_history_dir(), f"{audio_id}.wav")
+    try:
+        return send_file(path, mimetype='audio/wav', conditional=True, etag=True)
+    except FileNotFoundError:
+        return jsonify({'error': 'Audio not found or expired'}), 404
@@ -1,47 +1,139 @@
 import os
-import io
+import errno
 import json
+import logging
 import uuid
 import shutil
 import zipfile
+import tempfile
+import threading
+import unicodedata
+from urllib.parse import quote
 from datetime import datetime, timezone
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, request, jsonify, current_app, Response
 from app.config import is_valid_audio_id as is_valid_uuid
+from app.services.zip_stream import stream_zip
+from app.services.json_utils import dumps as json_dumps, loads as json_loads
+
+log = logging.getLogger(__name__)
 
 bp = Blueprint('profiles', __name__, url_prefix='/api/profiles')
 
+INDEX_FILENAME = '_index.json'
+# Serializes read-modify-write of the index file
+_index_lock = threading.Lock()
+
 
 def get_profiles_dir():
-    """Get the profiles directory path."""
-    profiles_dir = os.path.join(os.path.dirname(current_app.config['UPLOAD_FOLDER']), 'profiles')
-    os.makedirs(profiles_dir, exist_ok=True)
+    """Get the profiles directory path (created on first use per app)."""
+    profiles_dir = current_app.extensions.get('profiles_dir')
+    if profiles_dir is None:
+        profiles_dir = os.path.join(os.path.dirname(current_app.config['UPLOAD_FOLDER']), 'profiles')
+        os.makedirs(profiles_dir, exist_ok=True)
+        current_app.extensions['profiles_dir'] = profiles_dir
     return profiles_dir
 
 
+def _link_or_copy(src, dst):
+    """Hardlink src to dst, copying when the filesystem can't link."""
+    try:
+        os.link(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copy2(src, dst)
+
+
+def _profile_summary(data):
+    return {
+        'id': data.get('id'),
+        'name': data.get('name'),
+        'sample_count': len(data.get('samples', [])),
+        'created_at': data.get('created_at'),
+    }
+
+
+def _write_index(profiles_dir, entries):
+    """Atomically replace the profiles index."""
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=profiles_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(json_dumps(entries))
+        os.replace(tmp_path, os.path.join(profiles_dir, INDEX_FILENAME))
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _rebuild_index(profiles_dir):
+    """Scan every profile file and rewrite the index from them."""
+    entries = []
+    with os.scandir(profiles_dir) as it:
+        for entry in it:
+            # is_file() is answered from the directory read; skips audio dirs
+            if (entry.name.endswith('.json') and entry.name != INDEX_FILENAME
+                    and entry.is_file(follow_symlinks=False)):
+                try:
+                    with open(entry.path, 'rb') as f:
+                        entries.append(_profile_summary(json_loads(f.read())))
+                except (json.JSONDecodeError, IOError):
+                    continue
+    _write_index(profiles_dir, entries)
+    return entries
+
+
+def _load_index(profiles_dir):
+    """Read the index, rebuilding it if missing or unreadable. Caller holds _index_lock."""
+    try:
+        with open(os.path.join(profiles_dir, INDEX_FILENAME), 'rb') as f:
+            entries = json_loads(f.read())
+        if isinstance(entries, list):
+            return entries
+    except (json.JSONDecodeError, IOError):
+        pass
+    return _rebuild_index(profiles_dir)
+
+
+def _update_index(profiles_dir, update):
+    """Apply update(entries) -> entries to the index.
+
+    On failure the index is dropped so the next read rebuilds it from the
+    profile files instead of serving a stale list.
+    """
+    with _index_lock:
+        try:
+            _write_index(profiles_dir, update(_load_index(profiles_dir)))
+        except Exception:
+            log.exception("Failed to update profiles index; dropping it for rebuild")
+            try:
+                os.unlink(os.path.join(profiles_dir, INDEX_FILENAME))
+            except OSError:
+                pass
+
+
+def _index_add(profiles_dir, profile_data):
+    summary = _profile_summary(profile_data)
+    # A rebuild on a missing index already picks up the new profile file
+    _update_index(profiles_dir, lambda entries: [
+        e for e in entries if e.get('id') != summary['id']
+    ] + [summary])
+
+
+def _index_remove(profiles_dir, profile_id):
+    _update_index(profiles_dir, lambda entries: [e for e in entries if e.get('id') != profile_id])
+
+
 @bp.route('', methods=['GET'])
 def list_profiles():
     """List all saved voice profiles."""
     profiles_dir = get_profiles_dir()
-    profiles = []
-
-    for filename in os.listdir(profiles_dir):
-        if filename.endswith('.json'):
-            filepath = os.path.join(profiles_dir, filename)
-            try:
-                with open(filepath, 'r') as f:
-                    data = json.load(f)
-                    profiles.append({
-                        'id': data.get('id'),
-                        'name': data.get('name'),
-                        'sample_count': len(data.get('samples', [])),
-                        'created_at': data.get('created_at'),
-                    })
-            except (json.JSONDecodeError, IOError):
-                continue
+    with _index_lock:
+        profiles = _load_index(profiles_dir)
 
     # Sort by name
     profiles.sort(key=lambda p: p.get('name', '').lower())
-    return jsonify(profiles)
+    return Response(json_dumps(profiles), mimetype='application/json')
 
 
 @bp.route('/<profile_id>', methods=['GET'])
@@ -56,9 +148,9 @@ def get_profile(profile_id):
         return jsonify({'error': 'Profile not found'}), 404
 
     try:
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-        return jsonify(data)
+        with open(filepath, 'rb') as f:
+            data = json_loads(f.read())
+        return Response(json_dumps(data), mimetype='application/json')
     except (json.JSONDecodeError, IOError) as e:
         return jsonify({'error': str(e)}), 500
 
@@ -66,8 +158,8 @@ def get_profile(profile_id):
 @bp.route('', methods=['POST'])
 def create_profile():
     """Create a new voice profile from current samples."""
-    data = request.get_json()
-    if data is None:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
         return jsonify({'error': 'Invalid JSON'}), 400
 
     name = data.get('name', '').strip()
@@ -104,7 +196,7 @@ def create_profile():
             # Copy to profile directory with new ID
             new_sample_id = str(uuid.uuid4())
             dst_path = os.path.join(profile_audio_dir, f"{new_sample_id}.wav")
-            shutil.copy2(src_path, dst_path)
+            _link_or_copy(src_path, dst_path)
 
             profile_samples.append({
                 'id': new_sample_id,
@@ -124,13 +216,15 @@ def create_profile():
 
     filepath = os.path.join(profiles_dir, f"{profile_id}.json")
     try:
-        with open(filepath, 'w') as f:
-            json.dump(profile_data, f, indent=2)
+        with open(filepath, 'wb') as f:
+            f.write(json_dumps(profile_data, indent=True))
     except Exception:
         # Clean up orphaned audio directory on metadata write failure
         shutil.rmtree(profile_audio_dir, ignore_errors=True)
         raise
 
+    _index_add(profiles_dir, profile_data)
+
     return jsonify({
         'id': profile_id,
         'name': name,
@@ -147,21 +241,21 @@ def delete_profile(profile_id):
     filepath = os.path.join(profiles_dir, f"{profile_id}.json")
     profile_audio_dir = os.path.join(profiles_dir, profile_id)
 
-    if not os.path.exists(filepath):
-        return jsonify({'error': 'Profile not found'}), 404
-
     try:
-        # Delete metadata file
+        # Delete metadata file; its absence means there is no profile
         os.unlink(filepath)
-
-        # Delete audio files directory
-        if os.path.exists(profile_audio_dir):
-            shutil.rmtree(profile_audio_dir)
-
-        return jsonify({'success': True})
+    except FileNotFoundError:
+        return jsonify({'error': 'Profile not found'}), 404
     except IOError as e:
         return jsonify({'error': str(e)}), 500
 
+    # Delete audio files directory (tolerates it being gone already)
+    shutil.rmtree(profile_audio_dir, ignore_errors=True)
+
+    _index_remove(profiles_dir, profile_id)
+
+    return jsonify({'success': True})
+
 
 @bp.route('/<profile_id>/load', methods=['POST'])
 def load_profile(profile_id):
@@ -176,8 +270,8 @@ def load_profile(profile_id):
         return jsonify({'error': 'Profile not found'}), 404
 
     try:
-        with open(filepath, 'r') as f:
-            profile_data = json.load(f)
+        with open(filepath, 'rb') as f:
+            profile_data = json_loads(f.read())
 
         upload_folder = current_app.config['UPLOAD_FOLDER']
         loaded_samples = []
@@ -193,7 +287,10 @@ def load_profile(profile_id):
                 # Copy to uploads with new ID for this session
                 new_id = str(uuid.uuid4())
                 dst_path = os.path.join(upload_folder, f"{new_id}.wav")
-                shutil.copy2(src_path, dst_path)
+                _link_or_copy(src_path, dst_path)
+                # A link shares the profile file's old mtime; refresh it so
+                # the stale-upload sweep treats it as a new upload
+                os.utime(dst_path, None)
 
                 loaded_samples.append({
                     'id': new_id,
@@ -222,35 +319,51 @@ def export_profile(profile_id):
         return jsonify({'error': 'Profile not found'}), 404
 
     try:
-        with open(filepath, 'r') as f:
-            profile_data = json.load(f)
+        with open(filepath, 'rb') as f:
+            profile_data = json_loads(f.read())
 
-        # Create ZIP in memory
-        zip_buffer = io.BytesIO()
+        # Sanitize filename
+        safe_name = "".join(c for c in profile_data['name'] if c.isalnum() or c in (' ', '-', '_')).strip() or "profile"
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-            # Add metadata
-            zf.writestr('profile.json', json.dumps(profile_data, indent=2))
+    def members():
+        # Add metadata; small and text, so worth compressing
+        yield 'profile.json', json_dumps(profile_data, indent=True), zipfile.ZIP_DEFLATED
 
-            # Add audio files
-            for sample in profile_data.get('samples', []):
-                audio_path = os.path.join(profile_audio_dir, f"{sample['id']}.wav")
-                if os.path.exists(audio_path):
-                    zf.write(audio_path, f"audio/{sample['id']}.wav")
+        # Add audio files; stream_zip copies each open file in chunks and closes it
+        for sample in profile_data.get('samples', []):
+            audio_path = os.path.join(profile_audio_dir, f"{sample['id']}.wav")
+            try:
+                f = open(audio_path, 'rb')
+            except FileNotFoundError:
+                continue
+            yield f"audio/{sample['id']}.wav", f
 
-        zip_buffer.seek(0)
+    def stream():
+        try:
+            # PCM barely deflates, so the WAV members are stored as-is
+            yield from stream_zip(members(), compression=zipfile.ZIP_STORED)
+        except Exception:
+            # Headers are already sent; the truncated archive signals failure
+            log.exception("Profile export error")
 
-        # Sanitize filename
-        safe_name = "".join(c for c in profile_data['name'] if c.isalnum() or c in (' ', '-', '_')).strip() or "profile"
+    return Response(
+        stream(),
+        mimetype='application/zip',
+        headers={'Content-Disposition': _attachment_disposition(f"{safe_name}.zip")},
+    )
 
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{safe_name}.zip"
-        )
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+
+def _attachment_disposition(filename):
+    """Content-Disposition for a download, with an RFC 5987 name if non-ASCII."""
+    try:
+        filename.encode('ascii')
+        return f'attachment; filename="{filename}"'
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(filename, safe="!#$&+-.^_`|~")
+        return f'attachment; filename="{simple}"; filename*=UTF-8\'\'{quoted}'
 
 
 @bp.route('/import', methods=['POST'])
@@ -265,15 +378,18 @@ def import_profile():
         profiles_dir = get_profiles_dir()
 
         with zipfile.ZipFile(file, 'r') as zf:
+            # Read the central directory once; membership checks below are O(1)
+            names = set(zf.namelist())
+
             # Validate no path traversal in zip entries
-            for member in zf.namelist():
+            for member in names:
                 if os.path.isabs(member) or '..' in member:
                     return jsonify({'error': 'Invalid ZIP file: contains unsafe paths'}), 400
 
-            if 'profile.json' not in zf.namelist():
+            if 'profile.json' not in names:
                 return jsonify({'error': 'Invalid profile ZIP: missing profile.json'}), 400
 
-            profile_data = json.loads(zf.read('profile.json'))
+            profile_data = json_loads(zf.read('profile.json'))
 
             # Validate required fields
             if not isinstance(profile_data.get('name'), str) or not profile_data['name'].strip():
@@ -294,12 +410,12 @@ def import_profile():
                     if not sample_id or not is_valid_uuid(sample_id):
                         continue
                     old_audio_name = f"audio/{sample_id}.wav"
-                    if old_audio_name in zf.namelist():
+                    if old_audio_name in names:
                         new_sample_id = str(uuid.uuid4())
-                        audio_data = zf.read(old_audio_name)
                         new_audio_path = os.path.join(profile_audio_dir, f"{new_sample_id}.wav")
-                        with open(new_audio_path, 'wb') as f:
-                            f.write(audio_data)
+                        # Stream the member to disk instead of inflating it into memory
+                        with zf.open(old_audio_name) as src, open(new_audio_path, 'wb') as f:
+                            shutil.copyfileobj(src, f, 1024 * 1024)
                         new_samples.append({
                             'id': new_sample_id,
                             'transcript': str(sample.get('transcript', ''))[:1000],
@@ -318,12 +434,14 @@ def import_profile():
                 }
 
                 filepath = os.path.join(profiles_dir, f"{new_id}.json")
-                with open(filepath, 'w') as f:
-                    json.dump(new_profile, f, indent=2)
+                with open(filepath, 'wb') as f:
+                    f.write(json_dumps(new_profile, indent=True))
             except Exception:
                 shutil.rmtree(profile_audio_dir, ignore_errors=True)
                 raise
 
+            _index_add(profiles_dir, new_profile)
+
             return jsonify({
                 'id': new_id,
                 'name': new_profile['name'],
@@ -1,11 +1,18 @@
-import os
-import tempfile
-from flask import Blueprint, request, jsonify, current_app
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify
+from app.config import STT_SAMPLE_RATE, STT_DENOISE_MIN_SECONDS, STT_DENOISE_MIN_RMS
 from app.services.stt_service import stt_service
-from app.services.audio_utils import reduce_noise_file
+from app.services.diarization_service import diarization_service
+from app.services.audio_utils import (
+    reduce_noise, needs_noise_reduction, decode_to_array,
+)
 
 bp = Blueprint('stt', __name__, url_prefix='/api/stt')
 
+# Diarization runs here while the request thread transcribes. One worker is
+# enough: the pipeline is serialized by its model lock anyway.
+_diarize_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stt-diarize')
+
 
 @bp.route('', methods=['POST'])
 def transcribe():
@@ -22,84 +29,74 @@ def transcribe():
     denoise = request.form.get('denoise', 'true').lower() == 'true'
     word_timestamps = request.form.get('word_timestamps', 'false').lower() == 'true'
     diarize = request.form.get('diarize', 'false').lower() == 'true'
+    auto_detect = request.form.get('auto_detect', 'false').lower() == 'true'
+    language = None if auto_detect else request.form.get('language', 'en')
 
-    # Save to temporary file
-    temp_path = None
-    denoised_path = None
     try:
-        # Create temp file with appropriate extension
-        suffix = os.path.splitext(audio_file.filename)[1] or '.webm'
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-            audio_file.save(tmp)
-            temp_path = tmp.name
-
-        # Apply noise reduction if requested
-        transcribe_path = temp_path
-        if denoise:
+        # Decode straight from the upload stream to 16 kHz mono; the same
+        # array feeds noise reduction, Whisper and pyannote
+        audio = decode_to_array(audio_file.stream, STT_SAMPLE_RATE)
+        audio_sr = STT_SAMPLE_RATE
+
+        # Apply noise reduction if requested. Short or near-silent clips cost
+        # more to enhance than they gain
+        denoised = False
+        if denoise and needs_noise_reduction(audio, audio_sr, STT_DENOISE_MIN_SECONDS, STT_DENOISE_MIN_RMS):
             try:
-                denoised_path = reduce_noise_file(temp_path)
-                transcribe_path = denoised_path
+                audio = reduce_noise(audio, audio_sr)
+                denoised = True
             except Exception as e:
                 print(f"Noise reduction failed, using original: {e}")
 
+        # Start diarization first so pyannote overlaps with Whisper
+        diar_future = None
+        diar_error = None
+        if diarize:
+            if diarization_service.available:
+                diar_future = _diarize_pool.submit(
+                    diarization_service.diarize, audio, sample_rate=audio_sr,
+                )
+            else:
+                diar_error = 'pyannote-audio not available or HF_TOKEN not set'
+
         # Transcribe with options
         if word_timestamps or diarize:
-            auto_detect = request.form.get('auto_detect', 'false').lower() == 'true'
-            language = None if auto_detect else request.form.get('language', 'en')
             result = stt_service.transcribe_with_options(
-                transcribe_path, language=language,
+                audio, language=language,
                 word_timestamps=(word_timestamps or diarize),
             )
         else:
-            auto_detect = request.form.get('auto_detect', 'false').lower() == 'true'
-            language = None if auto_detect else request.form.get('language', 'en')
-            result = stt_service.transcribe(transcribe_path, language=language)
+            result = stt_service.transcribe(audio, language=language)
 
-        result['denoised'] = denoise and denoised_path is not None
+        result['denoised'] = denoised
 
-        # Run diarization if requested
-        if diarize:
+        if diar_future is not None:
             try:
-                from app.services.diarization_service import diarization_service
-                if diarization_service.available:
-                    diar_segments = diarization_service.diarize(transcribe_path)
-                    word_data = result.get('words', [])
-                    if word_data and diar_segments:
-                        result['speakers'] = diarization_service.merge_with_words(
-                            diar_segments, word_data
-                        )
-                    else:
-                        result['speakers'] = diar_segments
+                diar_segments = diar_future.result()
+                word_data = result.get('words', [])
+                if word_data and diar_segments:
+                    result['speakers'] = diarization_service.merge_with_words(
+                        diar_segments, word_data
+                    )
                 else:
-                    result['diarization_error'] = 'pyannote-audio not available or HF_TOKEN not set'
+                    result['speakers'] = diar_segments
             except Exception as e:
                 print(f"Diarization failed: {e}")
-                result['diarization_error'] = str(e)
+                diar_error = str(e)
+        if diar_error:
+            result['diarization_error'] = diar_error
 
         return jsonify(result)
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-    finally:
-        # Clean up temp files
-        if temp_path and os.path.exists(temp_path):
-            os.unlink(temp_path)
-        if denoised_path and os.path.exists(denoised_path):
-            os.unlink(denoised_path)
-
 
 @bp.route('/capabilities', methods=['GET'])
 def stt_capabilities():
     """Return available STT capabilities."""
-    try:
-        from app.services.diarization_service import diarization_service
-        diarization_available = diarization_service.available
-    except ImportError:
-        diarization_available = False
-
     return jsonify({
         'word_timestamps': True,
-        'diarization': diarization_available,
+        'diarization': diarization_service.available,
         'live_transcription': False,  # WebSocket not yet configured
     })
@@ -1,76 +1,256 @@
 import io
 import os
+import logging
 import time
 import uuid
 import struct
+import functools
 import threading
 from collections import OrderedDict
 import numpy as np
 import soundfile as sf
-from flask import Blueprint, request, jsonify, Response, current_app
+from flask import Blueprint, request, jsonify, Response, current_app, g, send_file
 from app.services.tts_service import tts_service
-from app.config import MAX_CACHED_AUDIO, AUDIO_CACHE_TTL_SECONDS, MAX_TEXT_LENGTH, MAX_INSTRUCT_LENGTH, is_valid_audio_id
-from app.services.audio_utils import VALID_SAMPLE_RATES
+from app.config import MAX_CACHED_AUDIO, AUDIO_CACHE_TTL_SECONDS, MAX_STREAM_CACHE_SECONDS, REF_AUDIO_CACHE_BYTES, STREAM_MIN_WRITE_BYTES, STREAM_MAX_WRITE_DELAY, MAX_TEXT_LENGTH, MAX_INSTRUCT_LENGTH, is_valid_audio_id
+from app.services.audio_utils import VALID_SAMPLE_RATES, PCM16Encoder
+from app.services.json_utils import dumps as json_dumps
 
 
-def create_wav_header(sample_rate: int, num_channels: int = 1, bits_per_sample: int = 16):
-    """Create a WAV header for streaming (size set to max)."""
-    byte_rate = sample_rate * num_channels * bits_per_sample // 8
-    block_align = num_channels * bits_per_sample // 8
-    # Use 0xFFFFFFFF for unknown size (streaming)
-    data_size = 0xFFFFFFFF - 36
+log = logging.getLogger(__name__)
+
+WAV_HEADER_SIZE = 44
+
 
-    header = struct.pack(
+def _wav_header(sample_rate, num_channels, bits_per_sample, data_size):
+    """Pack a 44-byte PCM WAV header for data_size bytes of samples."""
+    block_align = num_channels * bits_per_sample // 8
+    return struct.pack(
         '<4sI4s4sIHHIIHH4sI',
         b'RIFF',
-        0xFFFFFFFF,  # File size (unknown for streaming)
+        36 + data_size,  # File size minus the RIFF chunk header
         b'WAVE',
         b'fmt ',
         16,  # Subchunk1 size
         1,   # Audio format (PCM)
         num_channels,
         sample_rate,
-        byte_rate,
+        sample_rate * block_align,  # Byte rate
         block_align,
         bits_per_sample,
         b'data',
         data_size,
     )
-    return header
+
+
+@functools.lru_cache(maxsize=16)
+def create_wav_header(sample_rate: int, num_channels: int = 1, bits_per_sample: int = 16):
+    """Create a WAV header for streaming (size set to max).
+
+    Memoized: streams only ever use a handful of sample rates.
+    """
+    # Use 0xFFFFFFFF for unknown size (streaming)
+    return _wav_header(sample_rate, num_channels, bits_per_sample, 0xFFFFFFFF - 36)
+
+
+class _StreamMarker(bytes):
+    """An in-band text marker (JOB_ID/ERROR) in a PCM stream.
+
+    A distinct type so _coalesce_stream can send it as its own write
+    instead of merging it into buffered audio.
+    """
+
+
+def _stream_marker(kind, value):
+    """Encode a `<!--KIND:value-->` marker for the end of a stream."""
+    return _StreamMarker(f"<!--{kind}:{value}-->".encode())
+
+
+def _coalesce_stream(chunks, min_size=STREAM_MIN_WRITE_BYTES, max_delay=STREAM_MAX_WRITE_DELAY):
+    """Re-chunk a byte stream into writes of at least min_size bytes.
+
+    The first chunk (the WAV header) is sent on its own straight away so
+    the response starts before the model has produced any audio, and the
+    first audio chunk is likewise sent as soon as it arrives, so
+    coalescing never delays first audio. After that, short model chunks
+    stop costing a write each. max_delay is best-effort: it is only
+    checked when the next chunk arrives, so buffered bytes can wait up to
+    one generation interval longer than that with a slow producer.
+    Chunks may be bytes or byte-format memoryviews over a reused buffer:
+    each one is copied out (the WSGI server needs bytes) before the next
+    is requested. bytes chunks that are already big enough pass through
+    without a copy. Markers (_StreamMarker) flush any buffered audio and
+    then go out as a write of their own, never appended to PCM.
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is not None:
+        yield bytes(first)
+    buf = bytearray()
+    deadline = None
+    sent_audio = False
+    for chunk in chunks:
+        if isinstance(chunk, _StreamMarker):
+            if buf:
+                yield bytes(buf)
+                buf.clear()
+            yield bytes(chunk)
+            continue
+        if not buf and (len(chunk) >= min_size or not sent_audio):
+            sent_audio = True
+            yield bytes(chunk)
+            continue
+        if not buf:
+            deadline = time.monotonic() + max_delay
+        buf += chunk
+        if len(buf) >= min_size or time.monotonic() >= deadline:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
+
+
+def _stream_error(label, exc):
+    """Log a stream failure and return its ERROR marker bytes.
+
+    Call from the generator's except block so the traceback goes to the
+    module logger; the message is stringified once for the marker.
+    """
+    log.exception("Streaming %s error", label)
+    return _stream_marker('ERROR', exc)
+
 
 bp = Blueprint('tts', __name__, url_prefix='/api/tts')
 
-# Store generated audio for download (TTL-evicting cache)
-_generated_audio = OrderedDict()  # job_id -> (wav, sr, timestamp)
+
+def _parse_json_body():
+    """before_request hook: parse a POST body once into g.data.
+
+    Every POST route on the TTS blueprints takes a JSON object, so
+    anything else is rejected here before the view runs.
+    """
+    if request.method != 'POST':
+        return None
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Invalid JSON'}), 400
+    g.data = data
+    return None
+
+
+bp.before_request(_parse_json_body)
+
+# Store generated audio for download (TTL-evicting cache). Reads are
+# lock-free: entries are immutable tuples, replaced rather than mutated,
+# and a single lookup is atomic under the GIL. The lock guards mutation.
+_generated_audio = OrderedDict()  # job_id -> (wav, sr, timestamp, wav_bytes)
 _audio_cache_lock = threading.Lock()
 
 
-def _cache_audio(job_id, wav, sr):
-    """Store audio with TTL eviction."""
+def _encode_wav(wav, sr):
+    """Encode samples as a complete 16-bit PCM WAV file.
+
+    Packs the 44-byte header directly rather than going through libsndfile;
+    float samples are scaled and clipped like the streaming routes do.
+    """
+    wav = np.asarray(wav)
+    num_channels = wav.shape[1] if wav.ndim == 2 else 1
+    if wav.dtype != np.int16:
+        wav = PCM16Encoder().encode(wav.reshape(-1))
+    pcm = memoryview(np.ascontiguousarray(wav)).cast('B')
+    header = _wav_header(sr, num_channels, 16, len(pcm))
+    return b''.join((header, pcm))
+
+
+def _cache_audio(job_id, wav, sr, wav_bytes=None):
+    """Store audio with TTL eviction.
+
+    wav_bytes is the already-encoded WAV file, when the caller has one, so
+    replays don't re-encode it.
+    """
     now = time.time()
     with _audio_cache_lock:
-        _generated_audio[job_id] = (wav, sr, now)
-        expired = [
-            k for k, (_, _, ts) in _generated_audio.items()
-            if now - ts > AUDIO_CACHE_TTL_SECONDS
-        ]
-        for k in expired:
-            del _generated_audio[k]
+        _generated_audio[job_id] = (wav, sr, now, wav_bytes)
+        # Entries are inserted in timestamp order with one TTL, so expired
+        # ones are always at the front: stop at the first live entry
+        while _generated_audio:
+            _, _, ts, _ = next(iter(_generated_audio.values()))
+            if now - ts <= AUDIO_CACHE_TTL_SECONDS:
+                break
+            _generated_audio.popitem(last=False)
         while len(_generated_audio) > MAX_CACHED_AUDIO:
             _generated_audio.popitem(last=False)
 
 
+def _get_entry(job_id):
+    """Return the live cache entry for job_id; only expiry takes the lock."""
+    entry = _generated_audio.get(job_id)
+    if entry is None:
+        return None
+    if time.time() - entry[2] > AUDIO_CACHE_TTL_SECONDS:
+        with _audio_cache_lock:
+            if _generated_audio.get(job_id) is entry:
+                del _generated_audio[job_id]
+        return None
+    return entry
+
+
+def _cache_stream_wav(job_id, pcm, sr):
+    """Cache a streamed take collected as mono int16 PCM in a bytearray.
+
+    The stream reserves WAV_HEADER_SIZE placeholder bytes at the front;
+    the header is written into them so the buffer itself is cached as
+    the WAV file, with no final copy.
+    """
+    pcm[:WAV_HEADER_SIZE] = _wav_header(sr, 1, 16, len(pcm) - WAV_HEADER_SIZE)
+    samples = np.frombuffer(pcm, dtype=np.int16, offset=WAV_HEADER_SIZE)
+    _cache_audio(job_id, samples, sr, wav_bytes=pcm)
+
+
+def _cache_wav(job_id, wav, sr):
+    """Encode audio once, cache it, and return the WAV bytes for the response.
+
+    Only the encoded file is kept: the cached samples are an int16 view
+    into it, which is all download, history and similarity need.
+    """
+    wav_bytes = _encode_wav(wav, sr)
+    samples = np.frombuffer(wav_bytes, dtype=np.int16, offset=WAV_HEADER_SIZE)
+    if np.ndim(wav) == 2:
+        samples = samples.reshape(-1, np.shape(wav)[1])
+    _cache_audio(job_id, samples, sr, wav_bytes=wav_bytes)
+    return wav_bytes
+
+
 def get_cached_audio(job_id):
     """Retrieve cached audio, or None if expired/missing."""
+    entry = _get_entry(job_id)
+    if entry is None:
+        return None
+    return entry[0], entry[1]
+
+
+def get_cached_wav(job_id):
+    """Retrieve (wav_bytes, cached_at) for job_id, or None if expired/missing.
+
+    Encodes at most once per entry; the result is kept for later replays.
+    """
+    entry = _get_entry(job_id)
+    if entry is None:
+        return None
+    wav, sr, ts, wav_bytes = entry
+    if wav_bytes is not None:
+        return wav_bytes, ts
+
+    wav_bytes = _encode_wav(wav, sr)
     with _audio_cache_lock:
-        entry = _generated_audio.get(job_id)
-        if entry is None:
-            return None
-        wav, sr, ts = entry
-        if time.time() - ts > AUDIO_CACHE_TTL_SECONDS:
-            del _generated_audio[job_id]
-            return None
-        return wav, sr
+        if _generated_audio.get(job_id) is entry:
+            _generated_audio[job_id] = (wav, sr, ts, wav_bytes)
+    return wav_bytes, ts
+
+
+def get_cached_wav_bytes(job_id):
+    """Retrieve cached audio as encoded WAV bytes, or None if expired/missing."""
+    cached = get_cached_wav(job_id)
+    return cached[0] if cached else None
 
 
 def _validate_text(text, field_name="text"):
@@ -87,51 +267,59 @@ def _validate_instruct(instruct):
     return None
 
 
-def _extract_inference_params(data):
-    """Extract and validate inference params from request JSON.
-
-    Returns (params_dict, error_string). error_string is None on success.
+# Numeric request fields: (name, cast, lo, hi, neutral, type error, range error).
+# A value within 0.01 of `neutral` is accepted but dropped as a no-op.
+_INFERENCE_PARAM_SPEC = (
+    ('temperature', float, 0.1, 2.0, None,
+     'temperature must be numeric', 'temperature must be between 0.1 and 2.0'),
+    ('top_k', int, 1, 200, None,
+     'top_k must be an integer', 'top_k must be between 1 and 200'),
+    ('top_p', float, 0.0, 1.0, None,
+     'top_p must be numeric', 'top_p must be between 0.0 and 1.0'),
+    ('repetition_penalty', float, 1.0, 2.0, None,
+     'repetition_penalty must be numeric', 'repetition_penalty must be between 1.0 and 2.0'),
+)
+_POST_PROCESSING_SPEC = (
+    ('pitch_shift', float, -12, 12, 0.0,
+     'pitch_shift must be numeric', 'pitch_shift must be between -12 and +12'),
+    ('speed', float, 0.5, 2.0, 1.0,
+     'speed must be numeric', 'speed must be between 0.5 and 2.0'),
+)
+_SAMPLE_RATE_ERROR = f'sample_rate must be one of {sorted(VALID_SAMPLE_RATES)}'
+
+
+def _validate_numeric_fields(data, spec, out):
+    """Cast and range-check each spec'd field present in data into out.
+
+    Returns an error string, or None on success.
     """
-    params = {}
-    err = None
-
-    if 'temperature' in data and data['temperature'] is not None:
-        try:
-            v = float(data['temperature'])
-            if not (0.1 <= v <= 2.0):
-                return None, 'temperature must be between 0.1 and 2.0'
-            params['temperature'] = v
-        except (TypeError, ValueError):
-            return None, 'temperature must be numeric'
-
-    if 'top_k' in data and data['top_k'] is not None:
+    get = data.get
+    for name, cast, lo, hi, neutral, type_err, range_err in spec:
+        v = get(name)
+        if v is None:
+            continue
         try:
-            v = int(data['top_k'])
-            if not (1 <= v <= 200):
-                return None, 'top_k must be between 1 and 200'
-            params['top_k'] = v
+            v = cast(v)
         except (TypeError, ValueError):
-            return None, 'top_k must be an integer'
+            return type_err
+        if not (lo <= v <= hi):
+            return range_err
+        if neutral is not None and abs(v - neutral) < 0.01:
+            continue
+        out[name] = v
+    return None
 
-    if 'top_p' in data and data['top_p'] is not None:
-        try:
-            v = float(data['top_p'])
-            if not (0.0 <= v <= 1.0):
-                return None, 'top_p must be between 0.0 and 1.0'
-            params['top_p'] = v
-        except (TypeError, ValueError):
-            return None, 'top_p must be numeric'
 
-    if 'repetition_penalty' in data and data['repetition_penalty'] is not None:
-        try:
-            v = float(data['repetition_penalty'])
-            if not (1.0 <= v <= 2.0):
-                return None, 'repetition_penalty must be between 1.0 and 2.0'
-            params['repetition_penalty'] = v
-        except (TypeError, ValueError):
-            return None, 'repetition_penalty must be numeric'
+def _extract_inference_params(data):
+    """Extract and validate inference params from request JSON.
 
-    return params or None, err
+    Returns (params_dict, error_string). error_string is None on success.
+    """
+    params = {}
+    err = _validate_numeric_fields(data, _INFERENCE_PARAM_SPEC, params)
+    if err:
+        return None, err
+    return params or None, None
 
 
 def _extract_post_processing(data):
@@ -140,26 +328,9 @@ def _extract_post_processing(data):
     Returns (options_dict, error_string). error_string is None on success.
     """
     options = {}
-
-    if 'pitch_shift' in data and data['pitch_shift'] is not None:
-        try:
-            v = float(data['pitch_shift'])
-            if not (-12 <= v <= 12):
-                return None, 'pitch_shift must be between -12 and +12'
-            if abs(v) >= 0.01:
-                options['pitch_shift'] = v
-        except (TypeError, ValueError):
-            return None, 'pitch_shift must be numeric'
-
-    if 'speed' in data and data['speed'] is not None:
-        try:
-            v = float(data['speed'])
-            if not (0.5 <= v <= 2.0):
-                return None, 'speed must be between 0.5 and 2.0'
-            if abs(v - 1.0) >= 0.01:
-                options['speed'] = v
-        except (TypeError, ValueError):
-            return None, 'speed must be numeric'
+    err = _validate_numeric_fields(data, _POST_PROCESSING_SPEC, options)
+    if err:
+        return None, err
 
     if 'volume_normalize' in data and data['volume_normalize'] is not None:
         v = data['volume_normalize']
@@ -175,7 +346,7 @@ def _extract_post_processing(data):
         try:
             v = int(data['sample_rate'])
             if v not in VALID_SAMPLE_RATES:
-                return None, f'sample_rate must be one of {sorted(VALID_SAMPLE_RATES)}'
+                return None, _SAMPLE_RATE_ERROR
             options['sample_rate'] = v
         except (TypeError, ValueError):
             return None, 'sample_rate must be an integer'
@@ -183,10 +354,46 @@ def _extract_post_processing(data):
     return options or None, None
 
 
+_ref_audio_cache = OrderedDict()  # (path, size, mtime_ns) -> (wav, sr), LRU order
+_ref_audio_cache_bytes = 0
+_ref_audio_cache_lock = threading.Lock()
+
+
+def _load_reference_audio(path, size, mtime_ns):
+    """Decode a reference upload once; size/mtime in the key miss replaced files.
+
+    The cache is bounded by decoded bytes (REF_AUDIO_CACHE_BYTES), so a few
+    long uploads cannot pin unbounded memory; an upload that alone exceeds
+    the budget is decoded per request and never cached.
+    """
+    global _ref_audio_cache_bytes
+    key = (path, size, mtime_ns)
+    with _ref_audio_cache_lock:
+        hit = _ref_audio_cache.get(key)
+        if hit is not None:
+            _ref_audio_cache.move_to_end(key)
+            return hit
+
+    wav, sr = sf.read(path, dtype='float32', always_2d=False)
+    if wav.nbytes > REF_AUDIO_CACHE_BYTES:
+        return wav, sr
+    wav.flags.writeable = False  # shared between requests; callers copy it
+
+    with _ref_audio_cache_lock:
+        if key not in _ref_audio_cache:
+            _ref_audio_cache[key] = (wav, sr)
+            _ref_audio_cache_bytes += wav.nbytes
+            while _ref_audio_cache_bytes > REF_AUDIO_CACHE_BYTES:
+                _, (old, _) = _ref_audio_cache.popitem(last=False)
+                _ref_audio_cache_bytes -= old.nbytes
+    return wav, sr
+
+
 def _resolve_reference_audio(data, required=False):
     """Resolve reference audio ids/texts/weights from request JSON.
 
-    Returns (ref_audio_paths, ref_texts, error) tuple.
+    Returns (ref_audio, ref_texts, error) tuple, where ref_audio is a list
+    of decoded (wav, sr) pairs the TTS models take in place of paths.
     Also stores ref_weights in data['_ref_weights'] for downstream use.
     """
     ref_audio_ids = data.get('ref_audio_ids') or []
@@ -209,18 +416,26 @@ def _resolve_reference_audio(data, required=False):
         if not is_valid_audio_id(audio_id):
             return None, None, (f'Invalid audio ID: {audio_id}', 400)
 
-    ref_audio_paths = []
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    ref_audio = []
     for audio_id in ref_audio_ids:
-        path = os.path.join(current_app.config['UPLOAD_FOLDER'], f"{audio_id}.wav")
-        if not os.path.exists(path):
+        path = os.path.join(upload_folder, f"{audio_id}.wav")
+        try:
+            st = os.stat(path)
+            wav, sr = _load_reference_audio(path, st.st_size, st.st_mtime_ns)
+            # Per-request writable copy: the model may normalize/resample in
+            # place, and a memcpy is still far cheaper than a decode
+            ref_audio.append((wav.copy(), sr))
+        except FileNotFoundError:
             return None, None, (f'Reference audio not found: {audio_id}', 404)
-        ref_audio_paths.append(path)
+        except RuntimeError:
+            return None, None, (f'Reference audio is not readable: {audio_id}', 400)
 
-    while len(ref_texts) < len(ref_audio_paths):
+    while len(ref_texts) < len(ref_audio):
         ref_texts.append(None)
 
     # Store weights for downstream use
-    if isinstance(ref_weights, list) and len(ref_weights) == len(ref_audio_paths):
+    if isinstance(ref_weights, list) and len(ref_weights) == len(ref_audio):
         try:
             data['_ref_weights'] = [float(w) for w in ref_weights]
         except (TypeError, ValueError):
@@ -228,328 +443,114 @@ def _resolve_reference_audio(data, required=False):
     else:
         data['_ref_weights'] = None
 
-    return ref_audio_paths, ref_texts, None
-
+    return ref_audio, ref_texts, None
 
-@bp.route('/clone', methods=['POST'])
-def tts_clone():
-    """Generate speech using voice cloning with one or more reference samples"""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
-
-    text = data.get('text')
-    language = data.get('language', 'English')
-
-    err = _validate_text(text)
-    if err:
-        return jsonify({'error': err}), 400
-    ref_audio_paths, ref_texts, ref_err = _resolve_reference_audio(data, required=True)
-    if ref_err:
-        return jsonify({'error': ref_err[0]}), ref_err[1]
-
-    fast = data.get('fast', False)
-
-    inference_params, inf_err = _extract_inference_params(data)
-    if inf_err:
-        return jsonify({'error': inf_err}), 400
-    post_processing, pp_err = _extract_post_processing(data)
-    if pp_err:
-        return jsonify({'error': pp_err}), 400
-
-    try:
-        wav, sr = tts_service.generate_clone(
-            text, language, ref_audio_paths, ref_texts, fast=fast,
-            inference_params=inference_params, post_processing=post_processing,
-        )
 
-        # Store for download
-        job_id = str(uuid.uuid4())
-        _cache_audio(job_id, wav, sr)
-
-        # Return as streaming audio
-        buffer = io.BytesIO()
-        sf.write(buffer, wav, sr, format='WAV')
-        buffer.seek(0)
-
-        return Response(
-            buffer.read(),
-            mimetype='audio/wav',
-            headers={
-                'X-Job-Id': job_id,
-                'Content-Disposition': 'inline; filename="output.wav"'
-            }
-        )
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@bp.route('/clone/stream', methods=['POST'])
-def tts_clone_stream():
-    """Stream speech generation using voice cloning."""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
+def _clone_args(data):
+    """Validate /clone fields into generate_clone kwargs.
 
-    text = data.get('text')
-    language = data.get('language', 'English')
-    err = _validate_text(text)
+    Returns (kwargs, (error, status)); the error is None on success.
+    """
+    err = _validate_text(data.get('text'))
     if err:
-        return jsonify({'error': err}), 400
-    ref_audio_paths, ref_texts, ref_err = _resolve_reference_audio(data, required=True)
+        return None, (err, 400)
+    ref_audio, ref_texts, ref_err = _resolve_reference_audio(data, required=True)
     if ref_err:
-        return jsonify({'error': ref_err[0]}), ref_err[1]
-
-    fast = data.get('fast', False)
-
-    inference_params, inf_err = _extract_inference_params(data)
-    if inf_err:
-        return jsonify({'error': inf_err}), 400
-    post_processing, pp_err = _extract_post_processing(data)
-    if pp_err:
-        return jsonify({'error': pp_err}), 400
-
-    def generate():
-        header_sent = False
-        all_chunks = []
-        sample_rate = None
-
-        try:
-            for chunk, sr in tts_service.generate_clone_streaming(
-                text, language, ref_audio_paths, ref_texts, fast=fast,
-                inference_params=inference_params, post_processing=post_processing,
-            ):
-                if not header_sent:
-                    sample_rate = sr
-                    yield create_wav_header(sr)
-                    header_sent = True
-
-                # Convert float32 to int16
-                audio_int16 = np.clip(chunk * 32767, -32768, 32767).astype(np.int16)
-                all_chunks.append(chunk)
-                yield audio_int16.tobytes()
-
-            # Store complete audio for download
-            if all_chunks:
-                full_audio = np.concatenate(all_chunks)
-                job_id = str(uuid.uuid4())
-                _cache_audio(job_id, full_audio, sample_rate)
-                # Send job ID as final chunk marker (won't be played as audio)
-                yield f"<!--JOB_ID:{job_id}-->".encode()
-
-        except Exception as e:
-            print(f"Streaming clone error: {e}")
-            yield f"<!--ERROR:{str(e)}-->".encode()
-
-    return Response(
-        generate(),
-        mimetype='audio/wav',
-        headers={
-            'Cache-Control': 'no-cache',
-            'Transfer-Encoding': 'chunked',
-        }
-    )
+        return None, ref_err
 
+    return {
+        'text': data.get('text'),
+        'language': data.get('language', 'English'),
+        'ref_audio': ref_audio,
+        'ref_texts': ref_texts,
+        'fast': data.get('fast', False),
+    }, None
 
-@bp.route('/custom', methods=['POST'])
-def tts_custom():
-    """Generate speech using custom voice preset"""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
 
-    text = data.get('text')
-    language = data.get('language', 'English')
-    speaker = data.get('speaker')
+def _custom_args(data):
+    """Validate /custom fields into generate_custom kwargs."""
     instruct = data.get('instruct')
-    fast = data.get('fast', False)
-
-    err = _validate_text(text)
-    if err:
-        return jsonify({'error': err}), 400
-    err = _validate_instruct(instruct)
+    err = _validate_text(data.get('text')) or _validate_instruct(instruct)
     if err:
-        return jsonify({'error': err}), 400
-    if not speaker:
-        return jsonify({'error': 'Speaker is required'}), 400
-    ref_audio_paths, ref_texts, ref_err = _resolve_reference_audio(data, required=False)
+        return None, (err, 400)
+    if not data.get('speaker'):
+        return None, ('Speaker is required', 400)
+    ref_audio, ref_texts, ref_err = _resolve_reference_audio(data, required=False)
     if ref_err:
-        return jsonify({'error': ref_err[0]}), ref_err[1]
-
-    inference_params, inf_err = _extract_inference_params(data)
-    if inf_err:
-        return jsonify({'error': inf_err}), 400
-    post_processing, pp_err = _extract_post_processing(data)
-    if pp_err:
-        return jsonify({'error': pp_err}), 400
-
-    try:
-        wav, sr = tts_service.generate_custom(
-            text,
-            language,
-            speaker,
-            instruct,
-            fast=fast,
-            ref_audio_paths=ref_audio_paths,
-            ref_texts=ref_texts,
-            ref_weights=data.get('_ref_weights'),
-            inference_params=inference_params,
-            post_processing=post_processing,
-        )
-
-        # Store for download
-        job_id = str(uuid.uuid4())
-        _cache_audio(job_id, wav, sr)
-
-        # Return as audio
-        buffer = io.BytesIO()
-        sf.write(buffer, wav, sr, format='WAV')
-        buffer.seek(0)
-
-        return Response(
-            buffer.read(),
-            mimetype='audio/wav',
-            headers={
-                'X-Job-Id': job_id,
-                'Content-Disposition': 'inline; filename="output.wav"'
-            }
-        )
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@bp.route('/custom/stream', methods=['POST'])
-def tts_custom_stream():
-    """Stream speech generation using custom voice."""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
-
-    text = data.get('text')
-    language = data.get('language', 'English')
-    speaker = data.get('speaker')
+        return None, ref_err
+
+    return {
+        'text': data.get('text'),
+        'language': data.get('language', 'English'),
+        'speaker': data.get('speaker'),
+        'instruct': instruct,
+        'fast': data.get('fast', False),
+        'ref_audio': ref_audio,
+        'ref_texts': ref_texts,
+        'ref_weights': data.get('_ref_weights'),
+    }, None
+
+
+def _design_args(data):
+    """Validate /design fields into generate_design kwargs."""
     instruct = data.get('instruct')
-    fast = data.get('fast', False)
-
-    err = _validate_text(text)
-    if err:
-        return jsonify({'error': err}), 400
-    err = _validate_instruct(instruct)
+    err = _validate_text(data.get('text')) or _validate_instruct(instruct)
     if err:
-        return jsonify({'error': err}), 400
-    if not speaker:
-        return jsonify({'error': 'Speaker is required'}), 400
-    ref_audio_paths, ref_texts, ref_err = _resolve_reference_audio(data, required=False)
+        return None, (err, 400)
+    if not instruct:
+        return None, ('Voice design instruction is required', 400)
+    ref_audio, ref_texts, ref_err = _resolve_reference_audio(data, required=False)
     if ref_err:
-        return jsonify({'error': ref_err[0]}), ref_err[1]
-
-    inference_params, inf_err = _extract_inference_params(data)
-    if inf_err:
-        return jsonify({'error': inf_err}), 400
-    post_processing, pp_err = _extract_post_processing(data)
-    if pp_err:
-        return jsonify({'error': pp_err}), 400
-
-    def generate():
-        header_sent = False
-        all_chunks = []
-        sample_rate = None
-
-        try:
-            for chunk, sr in tts_service.generate_custom_streaming(
-                text,
-                language,
-                speaker,
-                instruct,
-                fast=fast,
-                ref_audio_paths=ref_audio_paths,
-                ref_texts=ref_texts,
-                ref_weights=data.get('_ref_weights'),
-                inference_params=inference_params,
-                post_processing=post_processing,
-            ):
-                if not header_sent:
-                    sample_rate = sr
-                    yield create_wav_header(sr)
-                    header_sent = True
-
-                audio_int16 = np.clip(chunk * 32767, -32768, 32767).astype(np.int16)
-                all_chunks.append(chunk)
-                yield audio_int16.tobytes()
-
-            if all_chunks:
-                full_audio = np.concatenate(all_chunks)
-                job_id = str(uuid.uuid4())
-                _cache_audio(job_id, full_audio, sample_rate)
-                yield f"<!--JOB_ID:{job_id}-->".encode()
+        return None, ref_err
 
-        except Exception as e:
-            print(f"Streaming custom error: {e}")
-            yield f"<!--ERROR:{str(e)}-->".encode()
+    return {
+        'text': data.get('text'),
+        'language': data.get('language', 'English'),
+        'instruct': instruct,
+        'ref_audio': ref_audio,
+        'ref_texts': ref_texts,
+        'ref_weights': data.get('_ref_weights'),
+    }, None
 
-    return Response(
-        generate(),
-        mimetype='audio/wav',
-        headers={
-            'Cache-Control': 'no-cache',
-            'Transfer-Encoding': 'chunked',
-        }
-    )
 
+# mode -> (argument parser, tts_service method, tts_service streaming method).
+# Methods are looked up by name per request so the service stays swappable.
+_DISPATCH = {
+    'clone': (_clone_args, 'generate_clone', 'generate_clone_streaming'),
+    'custom': (_custom_args, 'generate_custom', 'generate_custom_streaming'),
+    'design': (_design_args, 'generate_design', 'generate_design_streaming'),
+}
 
-@bp.route('/design', methods=['POST'])
-def tts_design():
-    """Generate speech using voice design"""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
 
-    text = data.get('text')
-    language = data.get('language', 'English')
-    instruct = data.get('instruct')
+def _handle_tts(mode, streaming):
+    """Shared view for /<mode> and /<mode>/stream."""
+    data = g.data
+    parse_args, method, stream_method = _DISPATCH[mode]
 
-    err = _validate_text(text)
+    kwargs, err = parse_args(data)
     if err:
-        return jsonify({'error': err}), 400
-    err = _validate_instruct(instruct)
-    if err:
-        return jsonify({'error': err}), 400
-    if not instruct:
-        return jsonify({'error': 'Voice design instruction is required'}), 400
-    ref_audio_paths, ref_texts, ref_err = _resolve_reference_audio(data, required=False)
-    if ref_err:
-        return jsonify({'error': ref_err[0]}), ref_err[1]
-
+        return jsonify({'error': err[0]}), err[1]
     inference_params, inf_err = _extract_inference_params(data)
     if inf_err:
         return jsonify({'error': inf_err}), 400
     post_processing, pp_err = _extract_post_processing(data)
     if pp_err:
         return jsonify({'error': pp_err}), 400
+    kwargs['inference_params'] = inference_params
+    kwargs['post_processing'] = post_processing
+
+    if streaming:
+        return _stream_tts(mode, getattr(tts_service, stream_method), kwargs, post_processing)
 
     try:
-        wav, sr = tts_service.generate_design(
-            text,
-            language,
-            instruct,
-            ref_audio_paths=ref_audio_paths,
-            ref_texts=ref_texts,
-            ref_weights=data.get('_ref_weights'),
-            inference_params=inference_params,
-            post_processing=post_processing,
-        )
+        wav, sr = getattr(tts_service, method)(**kwargs)
 
         # Store for download
         job_id = str(uuid.uuid4())
-        _cache_audio(job_id, wav, sr)
-
-        # Return as audio
-        buffer = io.BytesIO()
-        sf.write(buffer, wav, sr, format='WAV')
-        buffer.seek(0)
+        wav_bytes = _cache_wav(job_id, wav, sr)
 
         return Response(
-            buffer.read(),
+            wav_bytes,
             mimetype='audio/wav',
             headers={
                 'X-Job-Id': job_id,
@@ -560,81 +561,69 @@ def tts_design():
         return jsonify({'error': str(e)}), 500
 
 
-@bp.route('/design/stream', methods=['POST'])
-def tts_design_stream():
-    """Stream speech generation using voice design."""
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
-
-    text = data.get('text')
-    language = data.get('language', 'English')
-    instruct = data.get('instruct')
-
-    err = _validate_text(text)
-    if err:
-        return jsonify({'error': err}), 400
-    err = _validate_instruct(instruct)
-    if err:
-        return jsonify({'error': err}), 400
-    if not instruct:
-        return jsonify({'error': 'Voice design instruction is required'}), 400
-    ref_audio_paths, ref_texts, ref_err = _resolve_reference_audio(data, required=False)
-    if ref_err:
-        return jsonify({'error': ref_err[0]}), ref_err[1]
-
-    inference_params, inf_err = _extract_inference_params(data)
-    if inf_err:
-        return jsonify({'error': inf_err}), 400
-    post_processing, pp_err = _extract_post_processing(data)
-    if pp_err:
-        return jsonify({'error': pp_err}), 400
+def _stream_tts(mode, generate_streaming, kwargs, post_processing):
+    """Stream header, int16 PCM, then a JOB_ID (or ERROR) marker."""
+    sample_rate = tts_service.output_sample_rate(post_processing)
+    max_cache_bytes = MAX_STREAM_CACHE_SECONDS * sample_rate * 2
 
     def generate():
-        header_sent = False
-        all_chunks = []
-        sample_rate = None
+        # Keep the int16 PCM we already emit for the cache instead of float
+        # copies, behind a header slot so it becomes the cached WAV in place
+        pcm = bytearray(WAV_HEADER_SIZE)
+        encoder = PCM16Encoder()
+
+        # The rate is fixed by the request, so the header (and with it the
+        # HTTP response) goes out while the model is still generating
+        yield create_wav_header(sample_rate)
 
         try:
-            for chunk, sr in tts_service.generate_design_streaming(
-                text,
-                language,
-                instruct,
-                ref_audio_paths=ref_audio_paths,
-                ref_texts=ref_texts,
-                ref_weights=data.get('_ref_weights'),
-                inference_params=inference_params,
-                post_processing=post_processing,
-            ):
-                if not header_sent:
-                    sample_rate = sr
-                    yield create_wav_header(sr)
-                    header_sent = True
-
-                audio_int16 = np.clip(chunk * 32767, -32768, 32767).astype(np.int16)
-                all_chunks.append(chunk)
-                yield audio_int16.tobytes()
-
-            if all_chunks:
-                full_audio = np.concatenate(all_chunks)
+            for chunk, _ in generate_streaming(**kwargs):
+                # Convert float32 to int16 in reused scratch buffers. The view
+                # is copied into the cache and by _coalesce_stream before the
+                # next encode overwrites it, so no per-chunk tobytes()
+                audio_bytes = memoryview(encoder.encode(chunk)).cast('B')
+                if pcm is not None:
+                    if len(pcm) + len(audio_bytes) > max_cache_bytes:
+                        # Too long to keep in worker memory; still streamed, not cached
+                        log.warning("TTS stream exceeded %ss, not caching", MAX_STREAM_CACHE_SECONDS)
+                        pcm = None
+                    else:
+                        pcm += audio_bytes
+                yield audio_bytes
+
+            # Store complete audio for download
+            if pcm is not None and len(pcm) > WAV_HEADER_SIZE:
                 job_id = str(uuid.uuid4())
-                _cache_audio(job_id, full_audio, sample_rate)
-                yield f"<!--JOB_ID:{job_id}-->".encode()
+                _cache_stream_wav(job_id, pcm, sample_rate)
+                # Send job ID as final chunk marker (won't be played as audio)
+                yield _stream_marker('JOB_ID', job_id)
 
         except Exception as e:
-            print(f"Streaming design error: {e}")
-            yield f"<!--ERROR:{str(e)}-->".encode()
+            yield _stream_error(mode, e)
 
+    # _coalesce_stream only yields bytes, so Werkzeug's encoding wrapper
+    # around the iterable can be skipped
     return Response(
-        generate(),
+        _coalesce_stream(generate()),
         mimetype='audio/wav',
         headers={
             'Cache-Control': 'no-cache',
             'Transfer-Encoding': 'chunked',
-        }
+        },
+        direct_passthrough=True,
     )
 
 
+# POST /clone, /custom, /design and their /stream variants; the endpoint
+# names (tts.tts_clone, tts.tts_clone_stream, ...) are unchanged
+for _mode in _DISPATCH:
+    bp.add_url_rule(f'/{_mode}', endpoint=f'tts_{_mode}',
+                    view_func=functools.partial(_handle_tts, _mode, False), methods=['POST'])
+    bp.add_url_rule(f'/{_mode}/stream', endpoint=f'tts_{_mode}_stream',
+                    view_func=functools.partial(_handle_tts, _mode, True), methods=['POST'])
+del _mode
+
+
 @bp.route('/dialogue', methods=['POST'])
 def tts_dialogue():
     """Generate multi-speaker dialogue audio.
@@ -646,11 +635,9 @@ def tts_dialogue():
     Returns a single combined audio file with all segments concatenated.
     """
     from app.services.ssml_parser import parse_ssml
-    from app.services.audio_utils import apply_post_processing
+    from app.services.audio_utils import apply_post_processing, SampleBuffer
 
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
+    data = g.data
 
     # Parse input: either SSML or explicit segments
     ssml_text = data.get('ssml')
@@ -681,7 +668,11 @@ def tts_dialogue():
     default_speaker = data.get('speaker', 'Ryan')
 
     try:
-        all_audio = []
+        audio = SampleBuffer()
+        # The inter-segment gap is inserted before the next speech segment,
+        # not after each one, so none trails the last segment; explicit
+        # breaks are kept (silence is silence, so the order does not matter)
+        gap_pending = False
         sample_rate = None
 
         for seg in segments:
@@ -692,7 +683,7 @@ def tts_dialogue():
                 duration_ms = seg.get('duration_ms', 500)
                 if sample_rate:
                     silence_samples = int(sample_rate * duration_ms / 1000)
-                    all_audio.append(np.zeros(silence_samples, dtype=np.float32))
+                    audio.append_silence(silence_samples)
                 continue
 
             text = seg.get('text', '').strip()
@@ -708,7 +699,7 @@ def tts_dialogue():
             instruct = seg.get('instruct')
 
             # Per-segment prosody overrides
-            seg_prosody = seg.get('prosody', {})
+            seg_post = seg.get('prosody') or {}
 
             # Generate with custom voice model (supports speaker + instruct)
             wav, sr = tts_service.generate_custom(
@@ -717,44 +708,37 @@ def tts_dialogue():
                 speaker=speaker,
                 instruct=instruct,
                 inference_params=inference_params,
-                post_processing=seg_prosody if seg_prosody else None,
+                post_processing=seg_post or None,
             )
 
             if sample_rate is None:
                 sample_rate = sr
             elif sr != sample_rate:
+                # A segment whose prosody asked for another rate is brought
+                # back to the first segment's rate
                 from app.services.audio_utils import resample_audio
                 wav, _ = resample_audio(wav, sr, sample_rate)
 
-            all_audio.append(wav)
-
             # Add silence gap between segments
-            if silence_gap_ms > 0:
-                gap_samples = int(sample_rate * silence_gap_ms / 1000)
-                all_audio.append(np.zeros(gap_samples, dtype=np.float32))
+            if gap_pending and silence_gap_ms > 0:
+                audio.append_silence(int(sample_rate * silence_gap_ms / 1000))
+            audio.append(wav)
+            gap_pending = True
 
-        if not all_audio:
+        if sample_rate is None:
             return jsonify({'error': 'No audio generated'}), 400
 
-        # Remove trailing silence gap
-        if len(all_audio) > 1 and np.all(all_audio[-1] == 0):
-            all_audio.pop()
-
-        combined = np.concatenate(all_audio)
+        combined = audio.view()
 
         # Apply global post-processing
         if post_processing:
             combined, sample_rate = apply_post_processing(combined, sample_rate, post_processing)
 
         job_id = str(uuid.uuid4())
-        _cache_audio(job_id, combined, sample_rate)
-
-        buffer = io.BytesIO()
-        sf.write(buffer, combined, sample_rate, format='WAV')
-        buffer.seek(0)
+        wav_bytes = _cache_wav(job_id, combined, sample_rate)
 
         return Response(
-            buffer.read(),
+            wav_bytes,
             mimetype='audio/wav',
             headers={
                 'X-Job-Id': job_id,
@@ -765,28 +749,32 @@ def tts_dialogue():
         return jsonify({'error': str(e)}), 500
 
 
+# Static catalogues, serialized once at import
+_SPEAKERS = [
+    {"name": "Vivian", "description": "Bright, slightly edgy young female voice", "language": "Chinese"},
+    {"name": "Serena", "description": "Warm, gentle young female voice", "language": "Chinese"},
+    {"name": "Uncle_Fu", "description": "Seasoned male voice with a low, mellow timbre", "language": "Chinese"},
+    {"name": "Dylan", "description": "Youthful Beijing male voice with clear, natural timbre", "language": "Chinese (Beijing)"},
+    {"name": "Eric", "description": "Lively Chengdu male voice with slightly husky brightness", "language": "Chinese (Sichuan)"},
+    {"name": "Ryan", "description": "Dynamic male voice with strong rhythmic drive", "language": "English"},
+    {"name": "Aiden", "description": "Sunny American male voice with clear midrange", "language": "English"},
+    {"name": "Ono_Anna", "description": "Playful Japanese female voice with light, nimble timbre", "language": "Japanese"},
+    {"name": "Sohee", "description": "Warm Korean female voice with rich emotion", "language": "Korean"},
+]
+_SPEAKERS_JSON = json_dumps(_SPEAKERS)
+_LANGUAGES_JSON = json_dumps(tts_service.get_supported_languages())
+
+
 @bp.route('/speakers', methods=['GET'])
 def get_speakers():
     """Get list of available speakers for CustomVoice"""
-    speakers = [
-        {"name": "Vivian", "description": "Bright, slightly edgy young female voice", "language": "Chinese"},
-        {"name": "Serena", "description": "Warm, gentle young female voice", "language": "Chinese"},
-        {"name": "Uncle_Fu", "description": "Seasoned male voice with a low, mellow timbre", "language": "Chinese"},
-        {"name": "Dylan", "description": "Youthful Beijing male voice with clear, natural timbre", "language": "Chinese (Beijing)"},
-        {"name": "Eric", "description": "Lively Chengdu male voice with slightly husky brightness", "language": "Chinese (Sichuan)"},
-        {"name": "Ryan", "description": "Dynamic male voice with strong rhythmic drive", "language": "English"},
-        {"name": "Aiden", "description": "Sunny American male voice with clear midrange", "language": "English"},
-        {"name": "Ono_Anna", "description": "Playful Japanese female voice with light, nimble timbre", "language": "Japanese"},
-        {"name": "Sohee", "description": "Warm Korean female voice with rich emotion", "language": "Korean"},
-    ]
-    return jsonify(speakers)
+    return Response(_SPEAKERS_JSON, mimetype='application/json')
 
 
 @bp.route('/languages', methods=['GET'])
 def get_languages():
     """Get list of supported languages"""
-    languages = tts_service.get_supported_languages()
-    return jsonify(languages)
+    return Response(_LANGUAGES_JSON, mimetype='application/json')
 
 
 @bp.route('/similarity', methods=['POST'])
@@ -798,9 +786,7 @@ def tts_similarity():
     """
     from app.services.voice_similarity import voice_similarity_service
 
-    data = request.get_json()
-    if data is None:
-        return jsonify({'error': 'Invalid JSON'}), 400
+    data = g.data
 
     ref_audio_id = data.get('ref_audio_id')
     generated_job_id = data.get('generated_audio_id')
@@ -815,25 +801,17 @@ def tts_similarity():
     if not os.path.exists(ref_path):
         return jsonify({'error': 'Reference audio not found'}), 404
 
-    # Get generated audio from cache and write to temp file
+    # Generated audio is scored straight from the cache, no temp file
     entry = get_cached_audio(generated_job_id)
     if entry is None:
         return jsonify({'error': 'Generated audio not found or expired'}), 404
 
-    import tempfile
     wav, sr = entry
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
-            sf.write(tmp.name, wav, sr)
-            gen_path = tmp.name
-
-        result = voice_similarity_service.compare_files(ref_path, gen_path)
+        result = voice_similarity_service.compare_arrays(ref_path, wav, sr)
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        if 'gen_path' in locals() and os.path.exists(gen_path):
-            os.unlink(gen_path)
 
 
 @bp.route('/download/<job_id>', methods=['GET'])
@@ -842,20 +820,20 @@ def download_audio(job_id):
     if not is_valid_audio_id(job_id):
         return jsonify({'error': 'Invalid job ID'}), 400
 
-    entry = get_cached_audio(job_id)
-    if entry is None:
+    cached = get_cached_wav(job_id)
+    if cached is None:
         return jsonify({'error': 'Audio not found or expired'}), 404
+    wav_bytes, ts = cached
 
-    wav, sr = entry
-
-    buffer = io.BytesIO()
-    sf.write(buffer, wav, sr, format='WAV')
-    buffer.seek(0)
-
-    return Response(
-        buffer.read(),
+    # A job's audio never changes, so its ID is the ETag; conditional lets
+    # Werkzeug answer If-None-Match with 304 and Range with 206
+    return send_file(
+        io.BytesIO(wav_bytes),
         mimetype='audio/wav',
-        headers={
-            'Content-Disposition': f'attachment; filename="generated_{job_id[:8]}.wav"'
-        }
+        as_attachment=True,
+        download_name=f'generated_{job_id[:8]}.wav',
+        conditional=True,
+        etag=job_id,
+        last_modified=ts,
+        max_age=60,
     )
@@ -1,18 +1,135 @@
 """Shared audio processing utilities."""
-import os
 import subprocess
 import tempfile
+from fractions import Fraction
+from math import gcd
 import numpy as np
 import scipy.signal
 import soundfile as sf
 from app.services.clearvoice_service import clearvoice_service
 
+try:
+    import numba
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+try:
+    import soxr
+    SOXR_AVAILABLE = True
+except ImportError:
+    SOXR_AVAILABLE = False
+
+try:
+    import librosa
+    LIBROSA_AVAILABLE = True
+except ImportError:
+    LIBROSA_AVAILABLE = False
+
 # Valid output sample rates
 VALID_SAMPLE_RATES = {8000, 16000, 22050, 24000, 44100, 48000}
 
 
+if NUMBA_AVAILABLE:
+    @numba.njit(cache=True)
+    def _f32_to_i16(src, dst):
+        """Scale, clamp, round and narrow in one pass over src."""
+        for i in range(src.shape[0]):
+            v = src[i] * 32767.0
+            if v > 32767.0:
+                v = 32767.0
+            elif v < -32768.0:
+                v = -32768.0
+            dst[i] = round(v)  # round-half-even, like np.rint
+
+
+class PCM16Encoder:
+    """Convert float audio chunks to int16 PCM, reusing scratch buffers.
+
+    One encoder per stream: `encode()` returns a view into an internal
+    buffer that is overwritten by the next call, so callers must consume
+    it (copy it out, e.g. `.tobytes()` or `bytearray +=`) before encoding
+    the next chunk.
+    """
+
+    def __init__(self):
+        self._scratch = np.empty(0, dtype=np.float32)
+        self._out = np.empty(0, dtype=np.int16)
+
+    def encode(self, chunk):
+        n = len(chunk)
+        if n > len(self._out):
+            self._out = np.empty(n, dtype=np.int16)
+        out = self._out[:n]
+        if NUMBA_AVAILABLE:
+            # Fused kernel: reads each float once, writes int16, no scratch pass
+            _f32_to_i16(chunk, out)
+            return out
+        if n > len(self._scratch):
+            self._scratch = np.empty(n, dtype=np.float32)
+        scratch = self._scratch[:n]
+        np.multiply(chunk, 32767.0, out=scratch)
+        np.clip(scratch, -32768.0, 32767.0, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(out, scratch, casting='unsafe')
+        return out
+
+
+class SampleBuffer:
+    """Growable float32 mono sample buffer.
+
+    Capacity doubles as needed, so appending N segments costs about
+    log2(N) reallocations and the result is a view, not a concatenate.
+    """
+
+    def __init__(self, capacity=0):
+        self._buf = np.empty(capacity, dtype=np.float32)
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def _reserve(self, extra):
+        need = self._len + extra
+        if need > len(self._buf):
+            grown = np.empty(max(need, 2 * len(self._buf)), dtype=np.float32)
+            grown[:self._len] = self._buf[:self._len]
+            self._buf = grown
+
+    def append(self, samples):
+        n = len(samples)
+        self._reserve(n)
+        self._buf[self._len:self._len + n] = samples
+        self._len += n
+
+    def append_silence(self, n):
+        self._reserve(n)
+        self._buf[self._len:self._len + n] = 0.0
+        self._len += n
+
+    def view(self):
+        """The samples written so far (shares memory with the buffer)."""
+        return self._buf[:self._len]
+
+
+def downmix(data):
+    """Return float32 mono audio; multichannel input is averaged in one pass."""
+    if data.ndim == 1:
+        return np.ascontiguousarray(data, dtype=np.float32)
+    if data.shape[1] == 2:
+        # Stereo: add the two columns straight into a float32 result
+        mono = np.add(data[:, 0], data[:, 1], dtype=np.float32)
+        mono *= 0.5
+        return mono
+    return np.mean(data, axis=1, dtype=np.float32)
+
+
 def resample_audio(wav, sr, target_sr):
-    """Resample audio to a target sample rate using scipy.signal.resample.
+    """Resample audio to a target sample rate.
+
+    Uses soxr when available, otherwise a polyphase FIR filter
+    (scipy.signal.resample_poly); both avoid the full-length FFT of
+    scipy.signal.resample.
 
     Args:
         wav: numpy array of audio samples
@@ -24,9 +141,12 @@ def resample_audio(wav, sr, target_sr):
     """
     if sr == target_sr:
         return wav, target_sr
-    num_samples = round(len(wav) * target_sr / sr)
-    resampled = scipy.signal.resample(wav, num_samples)
-    return resampled.astype(np.float32), target_sr
+    if SOXR_AVAILABLE:
+        resampled = soxr.resample(np.asarray(wav, dtype=np.float32), sr, target_sr, quality='HQ')
+        return resampled, target_sr
+    g = gcd(sr, target_sr)
+    resampled = scipy.signal.resample_poly(wav, target_sr // g, sr // g)
+    return resampled.astype(np.float32, copy=False), target_sr
 
 
 def normalize_volume(wav, target_lufs=-16):
@@ -42,7 +162,9 @@ def normalize_volume(wav, target_lufs=-16):
     Returns:
         normalized wav array
     """
-    peak = np.max(np.abs(wav))
+    # Two reductions instead of np.abs(), which would copy the whole signal
+    mx, mn = wav.max(), wav.min()
+    peak = mx if mx > -mn else -mn
     if peak < 1e-8:
         return wav
 
@@ -50,7 +172,8 @@ def normalize_volume(wav, target_lufs=-16):
     # Linear scale: 10^(lufs/20) gives approximate peak target
     target_peak = min(10 ** (target_lufs / 20), 0.99)
     gain = target_peak / peak
-    return (wav * gain).astype(np.float32)
+    # Scale straight into a float32 result; wav may be shared, so not in place
+    return np.multiply(wav, gain, dtype=np.float32)
 
 
 def time_stretch(wav, sr, rate):
@@ -70,15 +193,14 @@ def time_stretch(wav, sr, rate):
     if abs(rate - 1.0) < 0.01:
         return wav, sr
 
-    try:
-        import librosa
+    if LIBROSA_AVAILABLE:
         stretched = librosa.effects.time_stretch(wav, rate=rate)
         return stretched.astype(np.float32), sr
-    except ImportError:
-        # Fallback: resample trick (changes pitch too, but works without librosa)
-        num_samples = round(len(wav) / rate)
-        stretched = scipy.signal.resample(wav, num_samples)
-        return stretched.astype(np.float32), sr
+
+    # Fallback: polyphase resample trick (changes pitch too, but works without librosa)
+    f = Fraction(rate).limit_denominator(1000)
+    stretched = scipy.signal.resample_poly(wav, f.denominator, f.numerator)
+    return stretched.astype(np.float32, copy=False), sr
 
 
 def pitch_shift(wav, sr, n_steps):
@@ -95,16 +217,16 @@ def pitch_shift(wav, sr, n_steps):
     if abs(n_steps) < 0.01:
         return wav, sr
 
-    try:
-        import librosa
+    if LIBROSA_AVAILABLE:
         shifted = librosa.effects.pitch_shift(wav, sr=sr, n_steps=n_steps)
         return shifted.astype(np.float32), sr
-    except ImportError:
-        # Fallback: resample-based pitch shift (changes speed too)
-        factor = 2 ** (n_steps / 12.0)
-        intermediate = scipy.signal.resample(wav, round(len(wav) / factor))
-        result = scipy.signal.resample(intermediate, len(wav))
-        return result.astype(np.float32), sr
+
+    # Fallback: resample-based pitch shift (changes speed too)
+    f = Fraction(2 ** (n_steps / 12.0)).limit_denominator(1000)
+    intermediate = scipy.signal.resample_poly(wav, f.denominator, f.numerator)
+    # resample_poly rounds lengths up, so the round trip is never short
+    result = scipy.signal.resample_poly(intermediate, f.numerator, f.denominator)[:len(wav)]
+    return result.astype(np.float32, copy=False), sr
 
 
 def apply_post_processing(wav, sr, options):
@@ -151,81 +273,74 @@ def apply_post_processing(wav, sr, options):
     return wav, sr
 
 
-def convert_to_wav(input_path):
-    """Convert any audio format to WAV using ffmpeg.
+def is_wav_file(path):
+    """Check for a RIFF/WAVE header without decoding any audio."""
+    with open(path, 'rb') as f:
+        header = f.read(12)
+    return len(header) == 12 and header[:4] == b'RIFF' and header[8:12] == b'WAVE'
+
+
+def needs_noise_reduction(audio_data, sample_rate, min_seconds, min_rms):
+    """Cheap pre-gate for reduce_noise: False for short or near-silent clips."""
+    if len(audio_data) < min_seconds * sample_rate:
+        return False
+    rms = np.sqrt(np.mean(np.square(audio_data, dtype=np.float64)))
+    return rms >= min_rms
 
-    Returns path to a temporary WAV file. Caller must delete it.
-    Returns the original path if already WAV/readable by soundfile.
+
+def decode_to_array(source, sr=24000):
+    """Decode audio to a mono float32 array at sr, without a temp file.
+
+    source is a path or a seekable binary file object (e.g. an upload
+    stream). Formats libsndfile can read are decoded directly; anything
+    else (e.g. WebM) is piped through ffmpeg, which also downmixes and
+    resamples.
     """
-    # Try reading directly first
     try:
-        sf.read(input_path, frames=1)
-        return input_path
+        data, file_sr = sf.read(source, dtype='float32', always_2d=False)
     except Exception:
-        pass
+        data = None
 
-    # Convert via ffmpeg
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
-        wav_path = tmp.name
+    if data is not None:
+        data, _ = resample_audio(downmix(data), file_sr, sr)
+        return data
 
+    cmd = ['ffmpeg', '-i', 'pipe:0', '-f', 'f32le', '-ar', str(sr), '-ac', '1', 'pipe:1']
     try:
-        subprocess.run(
-            ['ffmpeg', '-i', input_path, '-ar', '24000', '-ac', '1', '-y', wav_path],
-            capture_output=True, check=True,
-        )
-        return wav_path
+        if not hasattr(source, 'read'):
+            cmd[2] = source
+            proc = subprocess.run(cmd, capture_output=True, check=True)
+        else:
+            source.seek(0)
+            input_data = source.read()
+            try:
+                proc = subprocess.run(cmd, input=input_data, capture_output=True, check=True)
+            except subprocess.CalledProcessError:
+                # Some containers (e.g. MP4 with a trailing moov atom) need a seekable input
+                with tempfile.NamedTemporaryFile() as tmp:
+                    tmp.write(input_data)
+                    tmp.flush()
+                    cmd[2] = tmp.name
+                    proc = subprocess.run(cmd, capture_output=True, check=True)
     except (subprocess.CalledProcessError, FileNotFoundError) as e:
-        if os.path.exists(wav_path):
-            os.unlink(wav_path)
-        raise RuntimeError(f"Failed to convert audio to WAV: {e}") from e
+        raise RuntimeError(f"Failed to decode audio: {e}") from e
+    return np.frombuffer(proc.stdout, dtype=np.float32)
 
 
 def reduce_noise(audio_data, sample_rate):
     """Apply speech enhancement to audio data array.
 
-    Uses ClearerVoice MossFormer2 for superior noise removal.
-    Writes to temp file, processes, reads back to maintain sample rate.
+    Uses ClearerVoice MossFormer2 for superior noise removal. The array is
+    enhanced in memory and returned at the input sample rate.
     """
-    if len(audio_data.shape) > 1:
-        audio_data = np.mean(audio_data, axis=1)
-
-    # Write to temp file for ClearerVoice processing
-    with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp_in:
-        tmp_path = tmp_in.name
-        sf.write(tmp_path, audio_data, sample_rate)
-
-    try:
-        enhanced = clearvoice_service.enhance_file(tmp_path)
-    finally:
-        os.unlink(tmp_path)
+    # Downmix in float32 directly instead of upcasting to float64 and back
+    audio_data = downmix(audio_data)
 
-    # MossFormer2_SE_48K outputs at 48kHz regardless of input rate.
-    # Resample back to original sample rate if they differ.
-    CLEARVOICE_OUTPUT_SR = 48000
-    if isinstance(enhanced, np.ndarray):
-        if len(enhanced.shape) > 1:
-            enhanced = enhanced[0]  # Take first channel/batch
-        if sample_rate != CLEARVOICE_OUTPUT_SR:
-            num_samples = round(len(enhanced) * sample_rate / CLEARVOICE_OUTPUT_SR)
-            enhanced = scipy.signal.resample(enhanced, num_samples)
+    # MossFormer2_SE_48K runs (and outputs) at 48kHz regardless of input rate
+    CLEARVOICE_SR = 48000
+    audio_data, _ = resample_audio(audio_data, sample_rate, CLEARVOICE_SR)
+    enhanced = clearvoice_service.enhance_array(audio_data, CLEARVOICE_SR)
+    enhanced, _ = resample_audio(enhanced, CLEARVOICE_SR, sample_rate)
 
-    return enhanced.astype(np.float32)
+    return enhanced.astype(np.float32, copy=False)
 
-
-def reduce_noise_file(audio_path):
-    """Apply speech enhancement to an audio file.
-
-    Returns path to temporary file with enhanced audio.
-    Handles non-WAV formats (e.g. WebM) by converting first.
-    """
-    wav_path = convert_to_wav(audio_path)
-    try:
-        data, sr = sf.read(wav_path)
-        reduced = reduce_noise(data, sr)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as tmp:
-            sf.write(tmp.name, reduced, sr)
-            return tmp.name
-    finally:
-        if wav_path != audio_path and os.path.exists(wav_path):
-            os.unlink(wav_path)
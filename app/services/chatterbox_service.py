@@ -1,9 +1,9 @@
 import threading
 import numpy as np
 from chatterbox.mtl_tts import ChatterboxMultilingualTTS
-from app.config import CHATTERBOX_DEVICE
+from app.config import CHATTERBOX_DEVICE, SAMPLE_RATE
 from app.services.gpu_lock import gpu0_lock
-from app.services.audio_utils import apply_post_processing
+from app.services.audio_utils import apply_post_processing, resample_audio
 
 
 class ChatterboxService:
@@ -40,7 +40,17 @@ class ChatterboxService:
 
     @property
     def sample_rate(self):
-        return self.model.sr if self.model else 24000
+        return self.model.sr if self.model else SAMPLE_RATE
+
+    def output_sample_rate(self, post_processing=None):
+        """Sample rate generate_streaming() yields for these options.
+
+        Known before the model runs (or loads), so the route can send the
+        stream header first.
+        """
+        if post_processing and post_processing.get('sample_rate'):
+            return post_processing['sample_rate']
+        return SAMPLE_RATE
 
     def _chunk_audio(self, wav, sr, chunk_ms=100):
         """Yield fixed-duration chunks from a waveform."""
@@ -50,10 +60,17 @@ class ChatterboxService:
             wav = np.squeeze(wav)
             if wav.ndim > 1:
                 wav = wav[0]
+        # One float32 pass here (no-op if already float32) keeps the per-chunk
+        # int16 conversion in the routes on float32 loops
+        wav = np.ascontiguousarray(wav, dtype=np.float32)
 
         chunk_samples = max(int(sr * chunk_ms / 1000), 1)
-        for i in range(0, len(wav), chunk_samples):
-            yield wav[i:i + chunk_samples], sr
+        # Full chunks are rows of one zero-copy 2-D view; only the tail is sliced
+        n = len(wav) // chunk_samples
+        for row in wav[:n * chunk_samples].reshape(n, chunk_samples):
+            yield row, sr
+        if len(wav) > n * chunk_samples:
+            yield wav[n * chunk_samples:], sr
 
     def generate(self, text, language_id="en", audio_prompt_path=None,
                  exaggeration=0.5, cfg_weight=0.5, temperature=0.8,
@@ -106,6 +123,8 @@ class ChatterboxService:
             repetition_penalty=repetition_penalty, min_p=min_p, top_p=top_p,
             post_processing=post_processing,
         )
+        # No-op unless the model's rate differs from the advertised one
+        wav, sr = resample_audio(wav, sr, self.output_sample_rate(post_processing))
         yield from self._chunk_audio(wav, sr)
 
 
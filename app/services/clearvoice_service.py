@@ -1,6 +1,9 @@
 import threading
+import numpy as np
 import torch
 from clearvoice import ClearVoice
+# Private helper: clearvoice is pinned in pyproject.toml so this keeps working
+from clearvoice.utils.decode import decode_one_audio
 from app.config import CLEARVOICE_MODEL
 from app.services.gpu_lock import gpu0_lock
 
@@ -43,11 +46,21 @@ class ClearVoiceService:
             self._model_loaded = True
             print("ClearVoice model loaded successfully!")
 
-    def enhance_file(self, audio_path):
-        """Enhance audio file, return enhanced numpy array."""
+    def enhance_array(self, wav, sr):
+        """Enhance a mono float32 array already at the model's rate.
+
+        Feeds the network directly, skipping ClearVoice's file reader so no
+        WAV is written or decoded. Returns the enhanced 1-D array at sr.
+        """
         self.load_model()
-        with gpu0_lock:
-            return self.model(input_path=audio_path, online_write=False)
+        net = self.model.models[0]
+        if sr != net.args.sampling_rate:
+            raise ValueError(f"ClearVoice expects {net.args.sampling_rate} Hz input, got {sr}")
+        with gpu0_lock, torch.inference_mode():
+            enhanced = decode_one_audio(net.model, net.device, wav[np.newaxis, :], net.args)
+        if isinstance(enhanced, list):
+            enhanced = enhanced[0]
+        return np.asarray(enhanced).reshape(-1)
 
 
 clearvoice_service = ClearVoiceService()
@@ -59,14 +59,18 @@ class DiarizationService:
             self._model_loaded = True
             print("Diarization pipeline loaded successfully!")
 
-    def diarize(self, audio_path):
-        """Run speaker diarization on an audio file.
+    def diarize(self, audio, sample_rate=None):
+        """Run speaker diarization on an audio file or mono float32 array.
 
+        sample_rate is required when audio is an array.
         Returns list of segments: [{speaker, start, end}]
         """
         self.load_model()
+        if not isinstance(audio, str):
+            import torch
+            audio = {'waveform': torch.from_numpy(audio).unsqueeze(0), 'sample_rate': sample_rate}
         with self._model_lock:
-            diarization = self.pipeline(audio_path)
+            diarization = self.pipeline(audio)
 
         segments = []
         for turn, _, speaker in diarization.itertracks(yield_label=True):
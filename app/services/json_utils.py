@@ -0,0 +1,28 @@
+"""JSON encoding helpers for the larger payloads (history, profiles).
+
+Uses orjson when it is installed and falls back to the stdlib json module,
+so callers get UTF-8 bytes either way.
+"""
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps(obj, indent=False) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes, optionally indented by 2 spaces."""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode()
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def loads(data):
+    """Parse JSON from bytes or str. Errors subclass json.JSONDecodeError."""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
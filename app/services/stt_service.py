@@ -44,11 +44,11 @@ class STTService:
             self._model_loaded = True
             print("Whisper model loaded successfully!")
 
-    def transcribe(self, audio_path: str, language: str = None) -> dict:
-        """Transcribe audio file to text.
+    def transcribe(self, audio, language: str = None) -> dict:
+        """Transcribe audio to text.
 
         Args:
-            audio_path: path to audio file
+            audio: path to audio file, or 16 kHz mono float32 array
             language: language code (e.g., 'en'), or None for auto-detect
         """
         self.load_model()
@@ -60,7 +60,7 @@ class STTService:
             if language:
                 kwargs['language'] = language
 
-            segments, info = self.model.transcribe(audio_path, **kwargs)
+            segments, info = self.model.transcribe(audio, **kwargs)
             text = " ".join([segment.text.strip() for segment in segments])
 
             return {
@@ -70,12 +70,12 @@ class STTService:
                 "duration": info.duration,
             }
 
-    def transcribe_with_options(self, audio_path: str, language: str = None,
+    def transcribe_with_options(self, audio, language: str = None,
                                 word_timestamps: bool = False) -> dict:
         """Transcribe with optional word-level timestamps.
 
         Args:
-            audio_path: path to audio file
+            audio: path to audio file, or 16 kHz mono float32 array
             language: language code or None for auto-detect
             word_timestamps: if True, include word-level timing data
         """
@@ -89,7 +89,7 @@ class STTService:
             if language:
                 kwargs['language'] = language
 
-            segments, info = self.model.transcribe(audio_path, **kwargs)
+            segments, info = self.model.transcribe(audio, **kwargs)
 
             all_text_parts = []
             words = []
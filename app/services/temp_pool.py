@@ -0,0 +1,44 @@
+"""Reusable pool of scratch files for request handlers.
+
+Slots are created once and truncated on release, so a request costs no
+create/unlink pair. When every slot is busy the pool falls back to a
+regular temp file rather than blocking the request.
+"""
+import os
+import queue
+import tempfile
+from contextlib import contextmanager
+
+
+class TempFilePool:
+    def __init__(self, directory, size=8, timeout=0.05):
+        self._directory = directory
+        self._timeout = timeout
+        self._slots = queue.Queue()
+
+        os.makedirs(directory, exist_ok=True)
+        for i in range(size):
+            path = os.path.join(directory, f"slot_{i}")
+            open(path, 'wb').close()
+            self._slots.put(path)
+
+    @contextmanager
+    def slot(self, suffix=''):
+        """Yield a scratch file path; it is emptied (or deleted) on exit."""
+        try:
+            path = self._slots.get(timeout=self._timeout)
+            pooled = True
+        except queue.Empty:
+            fd, path = tempfile.mkstemp(suffix=suffix, dir=self._directory)
+            os.close(fd)
+            pooled = False
+
+        try:
+            yield path
+        finally:
+            if pooled:
+                # Recreates the slot if something deleted it while in use
+                open(path, 'wb').close()
+                self._slots.put(path)
+            elif os.path.exists(path):
+                os.unlink(path)
@@ -2,9 +2,9 @@ import torch
 import threading
 import numpy as np
 from qwen_tts import Qwen3TTSModel, Qwen3TTSTokenizer
-from app.config import TTS_MODEL_BASE_PATH as MODEL_BASE_PATH
+from app.config import TTS_MODEL_BASE_PATH as MODEL_BASE_PATH, SAMPLE_RATE
 from app.services.gpu_lock import gpu0_lock
-from app.services.audio_utils import apply_post_processing
+from app.services.audio_utils import apply_post_processing, resample_audio
 
 class TTSService:
     _instance = None
@@ -95,59 +95,62 @@ class TTSService:
             wav = np.squeeze(wav)
             if wav.ndim > 1:
                 wav = wav[0]
+        # One float32 pass here (no-op if already float32) keeps the per-chunk
+        # int16 conversion in the routes on float32 loops
+        wav = np.ascontiguousarray(wav, dtype=np.float32)
 
         chunk_samples = max(int(sr * chunk_ms / 1000), 1)
         for i in range(0, len(wav), chunk_samples):
             yield wav[i:i + chunk_samples], sr
 
-    def _normalize_clone_inputs(self, ref_audio_paths, ref_texts=None):
+    def _normalize_clone_inputs(self, ref_audio, ref_texts=None):
         """Normalize clone references into aligned lists."""
-        if not ref_audio_paths:
+        if not ref_audio:
             return [], []
-        if isinstance(ref_audio_paths, str):
-            ref_audio_paths = [ref_audio_paths]
+        if isinstance(ref_audio, str):
+            ref_audio = [ref_audio]
         if ref_texts is None:
             ref_texts = []
         elif isinstance(ref_texts, str):
             ref_texts = [ref_texts]
         else:
             ref_texts = list(ref_texts)
-        while len(ref_texts) < len(ref_audio_paths):
+        while len(ref_texts) < len(ref_audio):
             ref_texts.append(None)
-        return list(ref_audio_paths), ref_texts
+        return list(ref_audio), ref_texts
 
-    def _build_voice_clone_conditioning(self, ref_audio_paths, ref_texts=None,
+    def _build_voice_clone_conditioning(self, ref_audio, ref_texts=None,
                                          batch_size: int = 1, weights=None):
         """Build `voice_clone_prompt` (+ optional `ref_ids`) for non-base models.
 
         Args:
-            ref_audio_paths: list of reference audio paths
+            ref_audio: list of reference audio paths or (wav, sr) pairs
             ref_texts: list of reference transcripts
             batch_size: batch size for duplication
             weights: optional list of floats for weighted speaker embedding blending
 
         Note: this must run while holding `gpu0_lock` because it invokes the base model.
         """
-        ref_audio_paths, ref_texts = self._normalize_clone_inputs(ref_audio_paths, ref_texts)
-        if not ref_audio_paths:
+        ref_audio, ref_texts = self._normalize_clone_inputs(ref_audio, ref_texts)
+        if not ref_audio:
             return None, None
 
         # ICL (ref text + ref code) is only practical with a single reference sample.
         use_icl = (
-            len(ref_audio_paths) == 1
+            len(ref_audio) == 1
             and ref_texts
             and isinstance(ref_texts[0], str)
             and bool(ref_texts[0].strip())
         )
         if use_icl:
             prompt_items = self.clone_model.create_voice_clone_prompt(
-                ref_audio=ref_audio_paths[0],
+                ref_audio=ref_audio[0],
                 ref_text=ref_texts[0],
                 x_vector_only_mode=False,
             )
         else:
             prompt_items = self.clone_model.create_voice_clone_prompt(
-                ref_audio=ref_audio_paths,
+                ref_audio=ref_audio,
                 ref_text=None,
                 x_vector_only_mode=True,
             )
@@ -213,14 +216,32 @@ class TTSService:
             wav, sr = apply_post_processing(wav, sr, post_processing)
         return wav, sr
 
-    def generate_clone(self, text: str, language: str, ref_audio_paths, ref_texts=None,
+    def output_sample_rate(self, post_processing=None):
+        """Sample rate the streaming methods yield for these options.
+
+        Known before generation starts, so callers can send a stream
+        header without waiting for the first chunk.
+        """
+        if post_processing and post_processing.get('sample_rate'):
+            return post_processing['sample_rate']
+        return SAMPLE_RATE
+
+    def _stream_chunks(self, wav, sr, post_processing):
+        """Post-process a waveform and chunk it at output_sample_rate()."""
+        wav, sr = self._apply_post(wav, sr, post_processing)
+        # No-op unless the model's rate differs from the advertised one
+        wav, sr = resample_audio(wav, sr, self.output_sample_rate(post_processing))
+        yield from self._chunk_audio(wav, sr)
+
+    def generate_clone(self, text: str, language: str, ref_audio, ref_texts=None,
                        fast=False, inference_params=None, post_processing=None):
         """Generate speech using voice cloning with one or more reference samples.
 
         Args:
             text: Text to synthesize
             language: Language for synthesis
-            ref_audio_paths: Single path or list of paths to reference audio files
+            ref_audio: Single path or list of paths (or decoded (wav, sr) pairs)
+                of reference audio
             ref_texts: Single text or list of transcripts (optional, improves quality)
             fast: Use 0.6B model for faster generation
             inference_params: dict with temperature, top_k, top_p, repetition_penalty
@@ -230,10 +251,10 @@ class TTSService:
         with gpu0_lock:
             model = self.clone_model_fast if (fast and self.clone_model_fast) else self.clone_model
             # Normalize to lists if single values passed
-            if isinstance(ref_audio_paths, str):
-                ref_audio_paths = [ref_audio_paths]
+            if isinstance(ref_audio, str):
+                ref_audio = [ref_audio]
             if ref_texts is None:
-                ref_texts = [None] * len(ref_audio_paths)
+                ref_texts = [None] * len(ref_audio)
             elif isinstance(ref_texts, str):
                 ref_texts = [ref_texts]
 
@@ -241,7 +262,7 @@ class TTSService:
             wavs, sr = model.generate_voice_clone(
                 text=text,
                 language=language,
-                ref_audio=ref_audio_paths,
+                ref_audio=ref_audio,
                 ref_text=ref_texts,
                 **model_kwargs,
             )
@@ -254,7 +275,7 @@ class TTSService:
         speaker: str,
         instruct: str = None,
         fast=False,
-        ref_audio_paths=None,
+        ref_audio=None,
         ref_texts=None,
         ref_weights=None,
         inference_params=None,
@@ -271,9 +292,9 @@ class TTSService:
             }
             if instruct:
                 kwargs["instruct"] = instruct
-            if ref_audio_paths:
+            if ref_audio:
                 voice_clone_prompt, ref_ids = self._build_voice_clone_conditioning(
-                    ref_audio_paths, ref_texts, batch_size=1, weights=ref_weights
+                    ref_audio, ref_texts, batch_size=1, weights=ref_weights
                 )
                 if voice_clone_prompt is not None:
                     kwargs["voice_clone_prompt"] = voice_clone_prompt
@@ -285,7 +306,7 @@ class TTSService:
             return self._apply_post(wavs[0], sr, post_processing)
 
     def generate_design(self, text: str, language: str, instruct: str,
-                        ref_audio_paths=None, ref_texts=None, ref_weights=None,
+                        ref_audio=None, ref_texts=None, ref_weights=None,
                         inference_params=None, post_processing=None):
         """Generate speech using voice design"""
         self.load_models()
@@ -295,9 +316,9 @@ class TTSService:
                 "language": language,
                 "instruct": instruct,
             }
-            if ref_audio_paths:
+            if ref_audio:
                 voice_clone_prompt, ref_ids = self._build_voice_clone_conditioning(
-                    ref_audio_paths, ref_texts, batch_size=1, weights=ref_weights
+                    ref_audio, ref_texts, batch_size=1, weights=ref_weights
                 )
                 if voice_clone_prompt is not None:
                     kwargs["voice_clone_prompt"] = voice_clone_prompt
@@ -308,7 +329,7 @@ class TTSService:
             wavs, sr = self.design_model.generate_voice_design(**kwargs)
             return self._apply_post(wavs[0], sr, post_processing)
 
-    def generate_clone_streaming(self, text: str, language: str, ref_audio_paths, ref_texts=None,
+    def generate_clone_streaming(self, text: str, language: str, ref_audio, ref_texts=None,
                                   fast=False, inference_params=None, post_processing=None):
         """Generate speech using voice cloning with streaming output.
 
@@ -316,10 +337,10 @@ class TTSService:
         """
         self.load_models()
         model = self.clone_model_fast if (fast and self.clone_model_fast) else self.clone_model
-        if isinstance(ref_audio_paths, str):
-            ref_audio_paths = [ref_audio_paths]
+        if isinstance(ref_audio, str):
+            ref_audio = [ref_audio]
         if ref_texts is None:
-            ref_texts = [None] * len(ref_audio_paths)
+            ref_texts = [None] * len(ref_audio)
         elif isinstance(ref_texts, str):
             ref_texts = [ref_texts]
 
@@ -328,15 +349,14 @@ class TTSService:
             wavs, sr = model.generate_voice_clone(
                 text=text,
                 language=language,
-                ref_audio=ref_audio_paths,
+                ref_audio=ref_audio,
                 ref_text=ref_texts,
                 non_streaming_mode=False,
                 **model_kwargs,
             )
 
         wav = wavs[0] if isinstance(wavs, list) else wavs
-        wav, sr = self._apply_post(wav, sr, post_processing)
-        yield from self._chunk_audio(wav, sr)
+        yield from self._stream_chunks(wav, sr, post_processing)
 
     def generate_custom_streaming(
         self,
@@ -345,7 +365,7 @@ class TTSService:
         speaker: str,
         instruct: str = None,
         fast=False,
-        ref_audio_paths=None,
+        ref_audio=None,
         ref_texts=None,
         ref_weights=None,
         inference_params=None,
@@ -366,9 +386,9 @@ class TTSService:
         kwargs.update(self._extract_model_kwargs(inference_params))
 
         with gpu0_lock:
-            if ref_audio_paths:
+            if ref_audio:
                 voice_clone_prompt, ref_ids = self._build_voice_clone_conditioning(
-                    ref_audio_paths, ref_texts, batch_size=1, weights=ref_weights
+                    ref_audio, ref_texts, batch_size=1, weights=ref_weights
                 )
                 if voice_clone_prompt is not None:
                     kwargs["voice_clone_prompt"] = voice_clone_prompt
@@ -377,11 +397,10 @@ class TTSService:
             wavs, sr = model.generate_custom_voice(**kwargs)
 
         wav = wavs[0] if isinstance(wavs, list) else wavs
-        wav, sr = self._apply_post(wav, sr, post_processing)
-        yield from self._chunk_audio(wav, sr)
+        yield from self._stream_chunks(wav, sr, post_processing)
 
     def generate_design_streaming(self, text: str, language: str, instruct: str,
-                                   ref_audio_paths=None, ref_texts=None,
+                                   ref_audio=None, ref_texts=None,
                                    ref_weights=None,
                                    inference_params=None, post_processing=None):
         """Generate speech using voice design with streaming output."""
@@ -395,9 +414,9 @@ class TTSService:
         kwargs.update(self._extract_model_kwargs(inference_params))
 
         with gpu0_lock:
-            if ref_audio_paths:
+            if ref_audio:
                 voice_clone_prompt, ref_ids = self._build_voice_clone_conditioning(
-                    ref_audio_paths, ref_texts, batch_size=1, weights=ref_weights
+                    ref_audio, ref_texts, batch_size=1, weights=ref_weights
                 )
                 if voice_clone_prompt is not None:
                     kwargs["voice_clone_prompt"] = voice_clone_prompt
@@ -406,8 +425,7 @@ class TTSService:
             wavs, sr = self.design_model.generate_voice_design(**kwargs)
 
         wav = wavs[0] if isinstance(wavs, list) else wavs
-        wav, sr = self._apply_post(wav, sr, post_processing)
-        yield from self._chunk_audio(wav, sr)
+        yield from self._stream_chunks(wav, sr, post_processing)
 
     def get_supported_speakers(self):
         """Get list of supported speakers for CustomVoice model"""
@@ -50,27 +50,32 @@ class VoiceSimilarityService:
 
         Returns numpy array embedding, or None if extraction fails.
         """
+        import soundfile as sf
+        wav, sr = sf.read(audio_path, dtype='float32')
+        return self.embed_array(wav, sr)
+
+    def embed_array(self, wav, sr):
+        """Extract a speaker embedding from samples already in memory.
+
+        Accepts float or int16 samples, mono or (frames, channels).
+        """
+        from app.services.audio_utils import downmix
+        if np.issubdtype(wav.dtype, np.integer):
+            wav = wav.astype(np.float32) / 32768.0
+        wav = downmix(wav)
+
         self._load_encoder()
 
         if self.encoder is not None:
             from resemblyzer import preprocess_wav
-            import soundfile as sf
-            wav, sr = sf.read(audio_path)
-            if wav.ndim > 1:
-                wav = np.mean(wav, axis=1)
             processed = preprocess_wav(wav, source_sr=sr)
             return self.encoder.embed_utterance(processed)
         else:
             # Spectral fallback: use MFCCs
-            return self._spectral_embedding(audio_path)
+            return self._spectral_embedding(wav, sr)
 
-    def _spectral_embedding(self, audio_path):
+    def _spectral_embedding(self, wav, sr):
         """Fallback embedding using spectral features."""
-        import soundfile as sf
-        wav, sr = sf.read(audio_path)
-        if wav.ndim > 1:
-            wav = np.mean(wav, axis=1)
-
         try:
             import librosa
             mfcc = librosa.feature.mfcc(y=wav, sr=sr, n_mfcc=20)
@@ -117,4 +122,19 @@ class VoiceSimilarityService:
         }
 
 
+    def compare_arrays(self, reference_path, wav, sr):
+        """Compare a reference audio file with in-memory generated samples.
+
+        Returns dict with score (0-100%) and details.
+        """
+        emb1 = self.extract_embedding(reference_path)
+        emb2 = self.embed_array(wav, sr)
+        score = self.compute_similarity(emb1, emb2)
+
+        return {
+            'score': score,
+            'reference_path': reference_path,
+        }
+
+
 voice_similarity_service = VoiceSimilarityService()
@@ -0,0 +1,66 @@
+"""Incremental ZIP writer for streamed HTTP responses.
+
+zipfile can write to unseekable outputs (it falls back to data
+descriptors), so the archive is produced into a small sink that is
+drained after every member instead of being built in a BytesIO.
+"""
+import time
+import zipfile
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkSink:
+    """Write-only file object that collects bytes until drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(members, compression=zipfile.ZIP_STORED, compresslevel=None):
+    """Yield a ZIP archive chunk by chunk.
+
+    Args:
+        members: iterable of (arcname, data) where data is bytes, a
+            buffer, or a binary file object (copied in chunks, then
+            closed); consumed lazily so each member can be produced just
+            before it is written. A third item, (arcname, data,
+            compress_type), overrides the compression for that member.
+        compression: default zipfile compression method
+        compresslevel: compression level for DEFLATED members
+
+    At most one in-memory member (or one copy chunk of a file member) is
+    held at a time.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression, compresslevel=compresslevel) as zf:
+        for arcname, data, *override in members:
+            compress_type = override[0] if override else None
+            if not hasattr(data, 'read'):
+                zf.writestr(arcname, data, compress_type=compress_type)
+            else:
+                zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                zinfo.compress_type = compression if compress_type is None else compress_type
+                zinfo.external_attr = 0o600 << 16  # same as writestr
+                with data, zf.open(zinfo, 'w') as dest:
+                    while block := data.read(COPY_CHUNK_SIZE):
+                        dest.write(block)
+                        chunk = sink.drain()
+                        if chunk:
+                            yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    yield sink.drain()
@@ -221,33 +221,31 @@ async function _doGenerateStreaming(endpoint, body, onComplete) {
                 headerParsed = true;
             }
 
-            // Process complete samples (2 bytes per sample for int16)
+            // Process complete samples (2 bytes per sample for int16),
+            // stopping short of any backend marker so it is never played
             if (headerParsed && buffer.length >= STREAMING_CHUNK_BYTES) {
-                const samplesToProcess = Math.floor(buffer.length / 2) * 2;
-                const pcmBytes = buffer.slice(0, samplesToProcess);
-                allPcmChunks.push(pcmBytes);
-                const audioData = new Int16Array(pcmBytes.buffer);
-                await streamingPlayer.playChunk(audioData);
-                buffer = buffer.slice(samplesToProcess);
+                const samplesToProcess = Math.floor(findMarkerStart(buffer) / 2) * 2;
+                if (samplesToProcess >= STREAMING_CHUNK_BYTES) {
+                    const pcmBytes = buffer.slice(0, samplesToProcess);
+                    allPcmChunks.push(pcmBytes);
+                    const audioData = new Int16Array(pcmBytes.buffer);
+                    await streamingPlayer.playChunk(audioData);
+                    buffer = buffer.slice(samplesToProcess);
+                }
             }
         }
 
-        // Process remaining buffer — check tail for backend markers
+        // Process remaining buffer — PCM up to the backend marker, if any
         let jobId = null;
         if (headerParsed && buffer.length >= 2) {
-            const checkSize = Math.min(4096, buffer.length);
-            const tailText = new TextDecoder().decode(buffer.slice(buffer.length - checkSize));
+            const pcmEnd = findMarkerStart(buffer);
+            const markerText = new TextDecoder().decode(buffer.slice(pcmEnd));
 
-            const errorMatch = tailText.match(/<!--ERROR:([\s\S]+?)-->/);
+            const errorMatch = markerText.match(/<!--ERROR:([\s\S]+?)-->/);
             if (errorMatch) throw new Error((errorMatch[1] || 'Generation failed').trim());
 
-            const jobMatch = tailText.match(/<!--JOB_ID:([^>]+)-->/);
-            let pcmEnd = buffer.length;
-            if (jobMatch) {
-                jobId = jobMatch[1];
-                const markerPos = tailText.indexOf('<!--JOB_ID:');
-                pcmEnd = buffer.length - checkSize + markerPos;
-            }
+            const jobMatch = markerText.match(/<!--JOB_ID:([^>]+)-->/);
+            if (jobMatch) jobId = jobMatch[1];
 
             const samplesToProcess = Math.floor(pcmEnd / 2) * 2;
             if (samplesToProcess >= 2) {
@@ -323,6 +321,23 @@ function buildWavBlob(pcmChunks, sampleRate) {
     return new Blob([wavBuffer], { type: 'audio/wav' });
 }
 
+const STREAM_MARKER_PREFIXES = ['<!--JOB_ID:', '<!--ERROR:'].map(p => new TextEncoder().encode(p));
+
+// Offset where PCM stops in a stream buffer: the start of the first backend
+// marker, or of a trailing partial marker prefix that may still be completed
+// by the next read. buffer.length when there is neither.
+function findMarkerStart(buffer) {
+    for (let i = 0; i < buffer.length; i++) {
+        if (buffer[i] !== 0x3C) continue;  // '<'
+        for (const prefix of STREAM_MARKER_PREFIXES) {
+            let j = 0;
+            while (j < prefix.length && i + j < buffer.length && buffer[i + j] === prefix[j]) j++;
+            if (j === prefix.length || i + j === buffer.length) return i;
+        }
+    }
+    return buffer.length;
+}
+
 function writeString(view, offset, string) {
     for (let i = 0; i < string.length; i++) {
         view.setUint8(offset + i, string.charCodeAt(i));